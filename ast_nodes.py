@@ -3,119 +3,347 @@ AST (Abstract Syntax Tree) Module
 Defines all node types for representing mathematical expressions.
 """
 
+import sys
+import weakref
 from abc import ABC, abstractmethod
-from typing import List, Optional, Any
+from functools import lru_cache
+from typing import List, Optional
+
+
+# Intern table for hash-consing: structurally identical nodes share one instance.
+# Keys hold child ids, which stay valid because a live parent keeps its children alive.
+_intern_table: 'weakref.WeakValueDictionary[tuple, ASTNode]' = weakref.WeakValueDictionary()
+
+# Operators whose structural hash ignores operand order
+_COMMUTATIVE_OPS = ('+', '*')
+
+# Integer tag per node class; handler tables are tuples indexed by node._kind
+KIND_NUMBER = 0
+KIND_VARIABLE = 1
+KIND_BINOP = 2
+KIND_UNARYOP = 3
+KIND_FUNCTION_CALL = 4
+KIND_UNKNOWN = 5
+
+# Entries kept by each node-keyed memo cache. Bounded, so memoized results cannot pin
+# every node a long session has seen (the intern table above only holds them weakly).
+MEMO_CACHE_SIZE = 2048
+
+
+# Structural hashes of the identity constants folded by canonical_form
+_ZERO_HASH = hash(('Number', 0))
+_ONE_HASH = hash(('Number', 1))
+
+
+def _binop_hash(left_hash: int, op: str, right_hash: int) -> int:
+    """
+    Structural hash of a BinOp, equal to the hash of its canonical_form: operands of
+    + and * are unordered and the identities x+0, x-0, x*1, x*0 hash like their result.
+    """
+    if op == '+':
+        if left_hash == _ZERO_HASH:
+            return right_hash
+        if right_hash == _ZERO_HASH:
+            return left_hash
+    elif op == '-':
+        if right_hash == _ZERO_HASH:
+            return left_hash
+    elif op == '*':
+        if left_hash == _ZERO_HASH or right_hash == _ZERO_HASH:
+            return _ZERO_HASH
+        if left_hash == _ONE_HASH:
+            return right_hash
+        if right_hash == _ONE_HASH:
+            return left_hash
+    if op in _COMMUTATIVE_OPS:
+        # Order-independent so that x+y and y+x share a structural hash
+        if left_hash > right_hash:
+            left_hash, right_hash = right_hash, left_hash
+    return hash(('BinOp', left_hash, op, right_hash))
 
 
 class ASTNode(ABC):
-    """Base class for all AST nodes."""
+    """
+    Base class for all AST nodes.
+    Nodes are hash-consed on construction, so structural equality is identity.
+    The precomputed hash is structural: it treats + and * operands as unordered and
+    ignores identity operands, so it always equals the hash of the canonical_form.
+    """
+    
+    __slots__ = ('_hash', '__weakref__')
+    
+    _kind = KIND_UNKNOWN
     
     @abstractmethod
     def __repr__(self) -> str:
         pass
+    
+    def __eq__(self, other):
+        return self is other
+    
+    def __hash__(self):
+        return self._hash
 
 
 class Number(ASTNode):
     """Represents a numeric constant (integer)."""
     
-    def __init__(self, value: int):
-        self.value = value
+    __slots__ = ('value',)
     
-    def __repr__(self) -> str:
-        return f"Number({self.value})"
+    _kind = KIND_NUMBER
     
-    def __eq__(self, other):
-        return isinstance(other, Number) and self.value == other.value
+    def __new__(cls, value: int):
+        key = (cls, value)
+        node = _intern_table.get(key)
+        if node is None:
+            node = super().__new__(cls)
+            node.value = value
+            node._hash = hash(('Number', value))
+            _intern_table[key] = node
+        return node
     
-    def __hash__(self):
-        return hash(('Number', self.value))
+    def __repr__(self) -> str:
+        return f"Number({self.value})"
 
 
 class Variable(ASTNode):
     """Represents a single-letter variable (x, y, z, etc.)."""
     
-    def __init__(self, name: str):
-        self.name = name
+    __slots__ = ('name',)
     
-    def __repr__(self) -> str:
-        return f"Variable({self.name})"
+    _kind = KIND_VARIABLE
     
-    def __eq__(self, other):
-        return isinstance(other, Variable) and self.name == other.name
+    def __new__(cls, name: str):
+        # Interned (the lexer already does so for parsed input), so names built
+        # elsewhere also hit the identity fast path in dict lookups and comparisons;
+        # sys.intern only accepts exact str, other names are stored as given
+        if type(name) is str:
+            name = sys.intern(name)
+        key = (cls, name)
+        node = _intern_table.get(key)
+        if node is None:
+            node = super().__new__(cls)
+            node.name = name
+            node._hash = hash(('Variable', name))
+            _intern_table[key] = node
+        return node
     
-    def __hash__(self):
-        return hash(('Variable', self.name))
+    def __repr__(self) -> str:
+        return f"Variable({self.name})"
 
 
 class BinOp(ASTNode):
     """Represents a binary operation (e.g., a + b, a * b, a ^ b)."""
     
-    def __init__(self, left: ASTNode, op: str, right: ASTNode):
-        self.left = left
-        self.op = op  # '+', '-', '*', '/', '^'
-        self.right = right
+    __slots__ = ('left', 'op', 'right')
+    
+    _kind = KIND_BINOP
+    
+    def __new__(cls, left: ASTNode, op: str, right: ASTNode):
+        key = (cls, id(left), op, id(right))
+        node = _intern_table.get(key)
+        if node is None:
+            node = super().__new__(cls)
+            node.left = left
+            node.op = op  # '+', '-', '*', '/', '^'
+            node.right = right
+            node._hash = _binop_hash(left._hash, op, right._hash)
+            _intern_table[key] = node
+        return node
     
     def __repr__(self) -> str:
         return f"BinOp({self.left!r}, '{self.op}', {self.right!r})"
-    
-    def __eq__(self, other):
-        return (isinstance(other, BinOp) and 
-                self.left == other.left and 
-                self.op == other.op and 
-                self.right == other.right)
 
 
 class UnaryOp(ASTNode):
     """Represents a unary operation (e.g., -x)."""
     
-    def __init__(self, op: str, operand: ASTNode):
-        self.op = op  # '-' (unary minus)
-        self.operand = operand
+    __slots__ = ('op', 'operand')
+    
+    _kind = KIND_UNARYOP
+    
+    def __new__(cls, op: str, operand: ASTNode):
+        key = (cls, op, id(operand))
+        node = _intern_table.get(key)
+        if node is None:
+            node = super().__new__(cls)
+            node.op = op  # '-' (unary minus)
+            node.operand = operand
+            node._hash = hash(('UnaryOp', op, operand._hash))
+            _intern_table[key] = node
+        return node
     
     def __repr__(self) -> str:
         return f"UnaryOp('{self.op}', {self.operand!r})"
-    
-    def __eq__(self, other):
-        return (isinstance(other, UnaryOp) and 
-                self.op == other.op and 
-                self.operand == other.operand)
 
 
 class FunctionCall(ASTNode):
     """Represents a function call (sin, cos, tan, ln, sqrt)."""
     
-    def __init__(self, func_name: str, arg: ASTNode):
-        self.func_name = func_name  # 'sin', 'cos', 'tan', 'ln', 'sqrt'
-        self.arg = arg
+    __slots__ = ('func_name', 'arg')
+    
+    _kind = KIND_FUNCTION_CALL
+    
+    def __new__(cls, func_name: str, arg: ASTNode):
+        # Interned, so comparing names anywhere downstream is a pointer check
+        if type(func_name) is str:
+            func_name = sys.intern(func_name)
+        key = (cls, func_name, id(arg))
+        node = _intern_table.get(key)
+        if node is None:
+            node = super().__new__(cls)
+            node.func_name = func_name  # 'sin', 'cos', 'tan', 'ln', 'sqrt'
+            node.arg = arg
+            node._hash = hash(('FunctionCall', func_name, arg._hash))
+            _intern_table[key] = node
+        return node
     
     def __repr__(self) -> str:
         return f"FunctionCall('{self.func_name}', {self.arg!r})"
-    
-    def __eq__(self, other):
-        return (isinstance(other, FunctionCall) and 
-                self.func_name == other.func_name and 
-                self.arg == other.arg)
+
+
+# Identity constants folded by canonical_form (kept alive here, so interned for good)
+_ZERO = Number(0)
+_ONE = Number(1)
+
+
+@lru_cache(maxsize=MEMO_CACHE_SIZE)
+def canonical_form(node: ASTNode) -> ASTNode:
+    """
+    Return the interned node with the operands of every + and * put in a fixed order
+    and the trivial identities x+0, x-0, x*1 and x*0 folded away.
+    Expressions that differ only by commutation or such identities share one canonical
+    node, so comparing them is an identity check. The parsed tree itself keeps the
+    user's operand order.
+    """
+    # Iterative post-order walk, so long sums are not limited by the recursion limit.
+    # Results are keyed by id() (the tree keeps every node alive during the walk), and
+    # interned subtrees that repeat are looked up there instead of revisited.
+    results = {}
+    stack = [(node, False)]
+    while stack:
+        current, ready = stack.pop()
+        key = id(current)
+        if key in results:
+            continue
+        children = _canonical_operands(current)
+        if children and not ready:
+            # Revisit this node once its operands are canonical
+            stack.append((current, True))
+            stack.extend([(child, False) for child in children])
+            continue
+        results[key] = _canonicalize(current, results)
+    return results[id(node)]
+
+
+def _canonical_operands(node: ASTNode) -> tuple:
+    kind = node._kind
+    if kind == KIND_BINOP:
+        return (node.left, node.right)
+    if kind == KIND_UNARYOP:
+        return (node.operand,)
+    if kind == KIND_FUNCTION_CALL:
+        return (node.arg,)
+    return ()
+
+
+def _canonicalize(node: ASTNode, results: dict) -> ASTNode:
+    """Canonical form of one node, given the canonical forms of its operands in results."""
+    kind = node._kind
+    if kind == KIND_BINOP:
+        op = node.op
+        left = results[id(node.left)]
+        right = results[id(node.right)]
+        if op == '+':
+            if left is _ZERO:
+                return right
+            if right is _ZERO:
+                return left
+        elif op == '-':
+            if right is _ZERO:
+                return left
+        elif op == '*':
+            if left is _ZERO or right is _ZERO:
+                return _ZERO
+            if left is _ONE:
+                return right
+            if right is _ONE:
+                return left
+        if op in _COMMUTATIVE_OPS and hash(left) > hash(right):
+            left, right = right, left
+        return BinOp(left, op, right)
+    elif kind == KIND_UNARYOP:
+        return UnaryOp(node.op, results[id(node.operand)])
+    elif kind == KIND_FUNCTION_CALL:
+        return FunctionCall(node.func_name, results[id(node.arg)])
+    return node
 
 
 def print_ast(node: ASTNode, indent: int = 0) -> None:
     """Pretty print the AST structure."""
-    prefix = "  " * indent
-    
-    if isinstance(node, Number):
-        print(f"{prefix}Number: {node.value}")
-    elif isinstance(node, Variable):
-        print(f"{prefix}Variable: {node.name}")
-    elif isinstance(node, BinOp):
-        print(f"{prefix}BinOp: {node.op}")
-        print(f"{prefix}  Left:")
-        print_ast(node.left, indent + 2)
-        print(f"{prefix}  Right:")
-        print_ast(node.right, indent + 2)
-    elif isinstance(node, UnaryOp):
-        print(f"{prefix}UnaryOp: {node.op}")
-        print(f"{prefix}  Operand:")
-        print_ast(node.operand, indent + 2)
-    elif isinstance(node, FunctionCall):
-        print(f"{prefix}FunctionCall: {node.func_name}")
-        print(f"{prefix}  Argument:")
-        print_ast(node.arg, indent + 2)
+    lines: List[str] = []
+    format_ast(node, indent, lines)
+    if lines:
+        print("\n".join(lines))
+
+
+def format_ast(node: ASTNode, indent: int = 0, lines: Optional[List[str]] = None) -> List[str]:
+    """Render the AST structure as a list of indented lines (the text print_ast writes)."""
+    if lines is None:
+        lines = []
+    
+    # Explicit stack of pending output: either a finished line or a (node, indent) to expand
+    stack: list = [(node, indent)]
+    while stack:
+        entry = stack.pop()
+        if isinstance(entry, str):
+            lines.append(entry)
+            continue
+        current, depth = entry
+        formatter = _FORMATTERS[current._kind]
+        if formatter is not None:
+            prefix = _INDENTS[depth] if depth < len(_INDENTS) else "  " * depth
+            stack.extend(reversed(formatter(current, prefix, depth)))
+    return lines
+
+
+def _format_number(node: Number, prefix: str, indent: int) -> tuple:
+    return (f"{prefix}Number: {node.value}",)
+
+
+def _format_variable(node: Variable, prefix: str, indent: int) -> tuple:
+    return (f"{prefix}Variable: {node.name}",)
+
+
+def _format_binop(node: BinOp, prefix: str, indent: int) -> tuple:
+    return (f"{prefix}BinOp: {node.op}",
+            f"{prefix}  Left:",
+            (node.left, indent + 2),
+            f"{prefix}  Right:",
+            (node.right, indent + 2))
+
+
+def _format_unaryop(node: UnaryOp, prefix: str, indent: int) -> tuple:
+    return (f"{prefix}UnaryOp: {node.op}",
+            f"{prefix}  Operand:",
+            (node.operand, indent + 2))
+
+
+def _format_function_call(node: FunctionCall, prefix: str, indent: int) -> tuple:
+    return (f"{prefix}FunctionCall: {node.func_name}",
+            f"{prefix}  Argument:",
+            (node.arg, indent + 2))
+
+
+# Indexed by node._kind
+_FORMATTERS = (
+    _format_number,
+    _format_variable,
+    _format_binop,
+    _format_unaryop,
+    _format_function_call,
+    None,
+)
+
+# Precomputed indentation prefixes for typical tree depths
+_INDENTS = ["  " * i for i in range(64)]
@@ -3,112 +3,190 @@ Equality Checking Module
 Determines if two expressions are equivalent through symbolic simplification.
 """
 
-from ast_nodes import ASTNode, Number, Variable, BinOp, UnaryOp, FunctionCall
-from polynomial import normalize_expression, Polynomial, is_expandable
+import ast_nodes
+import polynomial
+from ast_nodes import (ASTNode, Number, Variable, BinOp, UnaryOp, FunctionCall, canonical_form,
+                       MEMO_CACHE_SIZE, KIND_BINOP, KIND_UNARYOP)
+from polynomial import normalize_expression, polynomial_fingerprint, products_differ, Polynomial, is_expandable
 from fractions import Fraction
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional
 
 
+@lru_cache(maxsize=MEMO_CACHE_SIZE)
 def simplify_to_rational(node: ASTNode) -> tuple:
     """
     Simplify an expression to a rational function form: numerator/denominator.
-    Both numerator and denominator are represented as polynomials (or expressions).
+    Both numerator and denominator are built directly in polynomial space, so
+    nested fractions combine without growing an intermediate AST.
     
     Returns:
-        (numerator_ast, denominator_ast) where both are AST nodes
+        (numerator, denominator) where both are normalized Polynomials
     """
-    if isinstance(node, Number):
-        # Constant: n/1
-        return node, Number(1)
-    
-    elif isinstance(node, Variable):
-        # Variable: x/1
-        return node, Number(1)
-    
-    elif isinstance(node, UnaryOp):
-        if node.op == '-':
-            # -expr = (-numerator)/denominator
-            num, den = simplify_to_rational(node.operand)
-            return UnaryOp('-', num), den
-        else:
-            raise ValueError(f"Unsupported unary operator: {node.op}")
-    
-    elif isinstance(node, BinOp):
-        if node.op == '+':
-            # a/b + c/d = (a*d + c*b)/(b*d)
-            num1, den1 = simplify_to_rational(node.left)
-            num2, den2 = simplify_to_rational(node.right)
-            
-            # numerator = num1*den2 + num2*den1
-            new_num = BinOp(
-                BinOp(num1, '*', den2),
-                '+',
-                BinOp(num2, '*', den1)
-            )
-            # denominator = den1*den2
-            new_den = BinOp(den1, '*', den2)
-            
-            return new_num, new_den
-        
-        elif node.op == '-':
-            # a/b - c/d = (a*d - c*b)/(b*d)
-            num1, den1 = simplify_to_rational(node.left)
-            num2, den2 = simplify_to_rational(node.right)
-            
-            # numerator = num1*den2 - num2*den1
-            new_num = BinOp(
-                BinOp(num1, '*', den2),
-                '-',
-                BinOp(num2, '*', den1)
-            )
-            # denominator = den1*den2
-            new_den = BinOp(den1, '*', den2)
-            
-            return new_num, new_den
-        
-        elif node.op == '*':
-            # (a/b) * (c/d) = (a*c)/(b*d)
-            num1, den1 = simplify_to_rational(node.left)
-            num2, den2 = simplify_to_rational(node.right)
-            
-            new_num = BinOp(num1, '*', num2)
-            new_den = BinOp(den1, '*', den2)
-            
-            return new_num, new_den
+    # Iterative post-order walk: a node is folded once all its operands have results.
+    # Interned subtrees that repeat are looked up in `results` instead of revisited.
+    results = {}
+    stack = [node]
+    while stack:
+        current = stack[-1]
+        if current in results:
+            stack.pop()
+            continue
         
-        elif node.op == '/':
-            # (a/b) / (c/d) = (a*d)/(b*c)
-            num1, den1 = simplify_to_rational(node.left)
-            num2, den2 = simplify_to_rational(node.right)
-            
-            new_num = BinOp(num1, '*', den2)
-            new_den = BinOp(den1, '*', num2)
-            
-            return new_num, new_den
+        operands = _rational_operands(current)
+        pending = [child for child in operands if child not in results]
+        if pending:
+            stack.extend(pending)
+            continue
         
-        elif node.op == '^':
-            # For now, treat power as atomic (can't simplify further)
-            return node, Number(1)
-        
-        else:
-            raise ValueError(f"Unsupported binary operator: {node.op}")
-    
-    elif isinstance(node, FunctionCall):
-        # Functions are atomic
-        return node, Number(1)
+        stack.pop()
+        results[current] = _SIMPLIFY[current._kind](current, *[results[child] for child in operands])
     
+    return results[node]
+
+
+def _rational_operands(node: ASTNode) -> tuple:
+    """Children whose rational forms are combined to build this node's rational form."""
+    if node._kind == KIND_BINOP:
+        # Powers are kept whole, so their operands are never simplified separately
+        return () if node.op == '^' else (node.left, node.right)
+    if node._kind == KIND_UNARYOP:
+        return (node.operand,)
+    return ()
+
+
+def _simplify_atom(node: ASTNode) -> tuple:
+    """Constants, variables and functions are atomic: n/1, x/1, f(x)/1."""
+    return normalize_expression(node), normalize_expression(Number(1))
+
+
+def _simplify_unknown(node: ASTNode) -> tuple:
+    raise ValueError(f"Unknown AST node type: {type(node)}")
+
+
+def _simplify_unary(node: UnaryOp, operand: tuple) -> tuple:
+    if node.op == '-':
+        # -expr = (-numerator)/denominator
+        num, den = operand
+        return -num, den
     else:
-        raise ValueError(f"Unknown AST node type: {type(node)}")
+        raise ValueError(f"Unsupported unary operator: {node.op}")
+
+
+def _simplify_binop(node: BinOp, *operands: tuple) -> tuple:
+    handler = _BINOP_SIMPLIFY.get(node.op)
+    if handler is None:
+        raise ValueError(f"Unsupported binary operator: {node.op}")
+    return handler(node, *operands)
+
+
+def _simplify_add(node: BinOp, left: tuple, right: tuple) -> tuple:
+    # a/b + c/d = (a*d + c*b)/(b*d)
+    num1, den1 = left
+    num2, den2 = right
+    
+    # numerator = num1*den2 + num2*den1
+    new_num = num1 * den2 + num2 * den1
+    # denominator = den1*den2
+    new_den = den1 * den2
+    
+    return new_num, new_den
+
+
+def _simplify_sub(node: BinOp, left: tuple, right: tuple) -> tuple:
+    # a/b - c/d = (a*d - c*b)/(b*d)
+    num1, den1 = left
+    num2, den2 = right
+    
+    # numerator = num1*den2 - num2*den1
+    new_num = num1 * den2 - num2 * den1
+    # denominator = den1*den2
+    new_den = den1 * den2
+    
+    return new_num, new_den
 
 
-def expand_and_normalize(node: ASTNode) -> Polynomial:
+def _simplify_mul(node: BinOp, left: tuple, right: tuple) -> tuple:
+    # (a/b) * (c/d) = (a*c)/(b*d)
+    num1, den1 = left
+    num2, den2 = right
+    
+    new_num = num1 * num2
+    new_den = den1 * den2
+    
+    return new_num, new_den
+
+
+def _simplify_div(node: BinOp, left: tuple, right: tuple) -> tuple:
+    # (a/b) / (c/d) = (a*d)/(b*c)
+    num1, den1 = left
+    num2, den2 = right
+    
+    new_num = num1 * den2
+    new_den = den1 * num2
+    
+    return new_num, new_den
+
+
+def _simplify_pow(node: BinOp) -> tuple:
+    # For now, keep power over a denominator of 1 (expanded or atomic as in normalization)
+    return normalize_expression(node), normalize_expression(Number(1))
+
+
+# Indexed by node._kind
+_SIMPLIFY = (
+    _simplify_atom,     # Number
+    _simplify_atom,     # Variable
+    _simplify_binop,    # BinOp
+    _simplify_unary,    # UnaryOp
+    _simplify_atom,     # FunctionCall
+    _simplify_unknown,
+)
+
+_BINOP_SIMPLIFY = {
+    '+': _simplify_add,
+    '-': _simplify_sub,
+    '*': _simplify_mul,
+    '/': _simplify_div,
+    '^': _simplify_pow,
+}
+
+
+@lru_cache(maxsize=MEMO_CACHE_SIZE)
+def expand_and_normalize(node: ASTNode) -> Optional[Polynomial]:
     """
     Expand and normalize an expression to polynomial form.
     This handles multiplication and addition/subtraction.
+    Returns None (cached, so repeats raise nothing) when the expression uses an
+    unsupported operator; any other exception is a bug and propagates.
     """
     try:
         return normalize_expression(node)
-    except Exception:
-        # If normalization fails, return as-is
+    except ValueError:
+        return None
+
+
+def polynomials_equal(node1: ASTNode, node2: ASTNode) -> bool:
+    """
+    Check whether two expressions normalize to the same polynomial.
+    Fingerprints are compared first, so most mismatches are rejected without
+    building either Polynomial; a fingerprint match is confirmed on the real terms.
+    """
+    try:
+        if polynomial_fingerprint(node1) != polynomial_fingerprint(node2):
+            return False
+    except ValueError:
+        return False
+    poly1 = expand_and_normalize(node1)
+    return poly1 is not None and poly1 == expand_and_normalize(node2)
+
+
+@lru_cache(maxsize=MEMO_CACHE_SIZE)
+def _rational_or_none(node: ASTNode) -> Optional[tuple]:
+    """simplify_to_rational, returning None instead of raising for unsupported operators."""
+    try:
+        return simplify_to_rational(node)
+    except ValueError:
         return None
 
 
@@ -117,48 +195,133 @@ def ast_equal(node1: ASTNode, node2: ASTNode) -> bool:
     Check if two AST nodes are structurally equal, considering commutativity.
     This is used for comparing function arguments and other subexpressions.
     """
+    if structurally_equal(node1, node2):
+        return True
+    return _ast_equal_pair(frozenset((node1, node2)))
+
+
+def structurally_equal(node1: ASTNode, node2: ASTNode) -> bool:
+    """
+    Cheap syntactic check: equal up to operand order of + and * and the identities
+    x+0, x-0, x*1, x*0. One memoized O(n) pass per expression, no polynomial expansion.
+    """
+    if node1 is node2:
+        return True
+    # Structural hashes match the canonical forms' hashes, so a mismatch rejects early
+    if hash(node1) != hash(node2):
+        return False
+    return canonical_form(node1) is canonical_form(node2)
+
+
+@lru_cache(maxsize=MEMO_CACHE_SIZE)
+def _ast_equal_pair(pair: frozenset) -> bool:
+    """
+    Memoized body of ast_equal, keyed on the unordered pair of nodes.
+    Operand pairs are compared with an explicit stack rather than by recursion, so deep
+    trees are bounded by memory rather than by the recursion limit. Each pair of
+    subtrees is settled at most once per call.
+    """
+    node1, node2 = pair
+    settled: Dict[frozenset, bool] = {}
+    
+    # Frame: [pair, alternatives, index of the alternative being tried, index of the
+    # operand pair within it]. An alternative holds operand pairs that must all be
+    # equal; the frame's pair is equal as soon as one alternative succeeds.
+    stack = [[pair, _equality_alternatives(node1, node2), 0, 0]]
+    while True:
+        frame = stack[-1]
+        key, alternatives, alt, sub = frame
+        if alternatives is True or alternatives is False:
+            result = alternatives
+        elif alt == len(alternatives):
+            result = False
+        elif sub == len(alternatives[alt]):
+            result = True
+        else:
+            left, right = alternatives[alt][sub]
+            operand_key = frozenset((left, right))
+            outcome = settled.get(operand_key)
+            if outcome is None:
+                # Settle the operand pair first, then come back to this frame
+                stack.append([operand_key, _equality_alternatives(left, right), 0, 0])
+            elif outcome:
+                frame[3] += 1
+            else:
+                # Short-circuit to the next alternative
+                frame[2] += 1
+                frame[3] = 0
+            continue
+        
+        stack.pop()
+        if not stack:
+            return result
+        settled[key] = result
+
+
+def _equality_alternatives(node1: ASTNode, node2: ASTNode):
+    """
+    True or False when the pair is settled directly, otherwise a tuple of alternatives,
+    each a tuple of operand pairs that must all be equal for the pair to be equal.
+    """
+    if structurally_equal(node1, node2):
+        return True
+    
     # Try polynomial normalization first
-    try:
-        poly1 = normalize_expression(node1)
-        poly2 = normalize_expression(node2)
-        if poly1 == poly2:
-            return True
-    except Exception:
-        pass
+    if polynomials_equal(node1, node2):
+        return True
     
     # Check structural equality
     if type(node1) != type(node2):
         return False
     
-    if isinstance(node1, Number):
-        return node1.value == node2.value
+    handler = _EQUAL[node1._kind]
+    return handler is not None and handler(node1, node2)
+
+
+def _equal_number(node1: Number, node2: Number) -> bool:
+    return node1.value == node2.value
+
+
+def _equal_variable(node1: Variable, node2: Variable) -> bool:
+    return node1.name == node2.name
+
+
+def _equal_unary(node1: UnaryOp, node2: UnaryOp):
+    if node1.op != node2.op:
+        return False
+    return (((node1.operand, node2.operand),),)
+
+
+def _equal_binop(node1: BinOp, node2: BinOp):
+    if node1.op != node2.op:
+        return False
     
-    elif isinstance(node1, Variable):
-        return node1.name == node2.name
+    # Direct equality
+    alternatives = [((node1.left, node2.left), (node1.right, node2.right))]
     
-    elif isinstance(node1, UnaryOp):
-        return node1.op == node2.op and ast_equal(node1.operand, node2.operand)
+    # Commutative equality for +, *
+    if node1.op in ('+', '*'):
+        alternatives.append(((node1.left, node2.right), (node1.right, node2.left)))
     
-    elif isinstance(node1, BinOp):
-        if node1.op != node2.op:
-            return False
-        
-        # Check direct equality
-        if ast_equal(node1.left, node2.left) and ast_equal(node1.right, node2.right):
-            return True
-        
-        # Check commutative equality for +, *
-        if node1.op in ('+', '*'):
-            if ast_equal(node1.left, node2.right) and ast_equal(node1.right, node2.left):
-                return True
-        
+    return tuple(alternatives)
+
+
+def _equal_function(node1: FunctionCall, node2: FunctionCall):
+    # Function names are usually interned by FunctionCall, so == settles on identity
+    if node1.func_name != node2.func_name:
         return False
-    
-    elif isinstance(node1, FunctionCall):
-        return (node1.func_name == node2.func_name and 
-                ast_equal(node1.arg, node2.arg))
-    
-    return False
+    return (((node1.arg, node2.arg),),)
+
+
+# Indexed by node._kind
+_EQUAL = (
+    _equal_number,
+    _equal_variable,
+    _equal_binop,
+    _equal_unary,
+    _equal_function,
+    None,
+)
 
 
 def are_equivalent(expr1: ASTNode, expr2: ASTNode) -> bool:
@@ -178,44 +341,49 @@ def are_equivalent(expr1: ASTNode, expr2: ASTNode) -> bool:
     Returns:
         True if expressions are provably equivalent, False otherwise
     """
+    # Fast path: syntactically identical up to commutativity
+    if structurally_equal(expr1, expr2):
+        return True
+    return _are_equivalent_pair(frozenset((expr1, expr2)))
+
+
+@lru_cache(maxsize=MEMO_CACHE_SIZE)
+def _are_equivalent_pair(pair: frozenset) -> bool:
+    """
+    Memoized body of are_equivalent, keyed on the unordered pair of nodes.
+    Nodes are interned, so a pair repeated across test cases (in either order)
+    is answered from the cache without touching the polynomials again.
+    """
+    expr1, expr2 = pair
+    
     # Strategy 1: Try polynomial normalization (fast for simple cases)
-    try:
-        poly1 = normalize_expression(expr1)
-        poly2 = normalize_expression(expr2)
-        
-        if poly1 == poly2:
-            return True
-    except Exception:
-        pass
+    if polynomials_equal(expr1, expr2):
+        return True
+    
+    # Pure +, -, * expressions have no atoms and a unit denominator, so the
+    # polynomial comparison is decisive and the later strategies cannot succeed
+    if is_expandable(expr1) and is_expandable(expr2):
+        return False
     
     # Strategy 2: Check structural equality (handles functions with equivalent arguments)
     if ast_equal(expr1, expr2):
         return True
     
     # Strategy 3: Rational form comparison
-    try:
-        # Convert both expressions to rational form
-        num1, den1 = simplify_to_rational(expr1)
-        num2, den2 = simplify_to_rational(expr2)
-        
-        # a/b = c/d iff a*d = b*c
-        # So we need to check if num1*den2 = num2*den1
-        
-        left_side = BinOp(num1, '*', den2)
-        right_side = BinOp(num2, '*', den1)
-        
-        # Try to normalize both sides
-        try:
-            left_poly = normalize_expression(left_side)
-            right_poly = normalize_expression(right_side)
-            
-            return left_poly == right_poly
-        except Exception:
-            # If normalization fails, we can't prove equivalence
-            return False
+    # Convert both expressions to rational form
+    rational1 = _rational_or_none(expr1)
+    rational2 = _rational_or_none(expr2)
+    if rational1 is None or rational2 is None:
+        return False
+    num1, den1 = rational1
+    num2, den2 = rational2
     
-    except Exception:
+    # a/b = c/d iff a*d = b*c
+    # Compare the products' fingerprints first: a mismatch proves num1*den2 != num2*den1
+    # without multiplying out either side
+    if products_differ(num1, den2, num2, den1):
         return False
+    return num1 * den2 == num2 * den1
 
 
 def check_equivalence_verbose(expr1: ASTNode, expr2: ASTNode) -> tuple:
@@ -226,14 +394,10 @@ def check_equivalence_verbose(expr1: ASTNode, expr2: ASTNode) -> tuple:
         (is_equivalent: bool, method: str, details: str)
     """
     # Try polynomial normalization first
-    try:
-        poly1 = normalize_expression(expr1)
-        poly2 = normalize_expression(expr2)
-        
-        if poly1 == poly2:
-            return True, "polynomial", f"{poly1} = {poly2}"
-    except Exception:
-        pass
+    if polynomials_equal(expr1, expr2):
+        poly1 = expand_and_normalize(expr1)
+        poly2 = expand_and_normalize(expr2)
+        return True, "polynomial", f"{poly1} = {poly2}"
     
     # Try structural equality (for functions with equivalent arguments)
     if ast_equal(expr1, expr2):
@@ -245,19 +409,110 @@ def check_equivalence_verbose(expr1: ASTNode, expr2: ASTNode) -> tuple:
         num2, den2 = simplify_to_rational(expr2)
         
         # Cross multiply: a/b = c/d iff a*d = b*c
-        left_side = BinOp(num1, '*', den2)
-        right_side = BinOp(num2, '*', den1)
+        left_poly = num1 * den2
+        right_poly = num2 * den1
         
-        try:
-            left_poly = normalize_expression(left_side)
-            right_poly = normalize_expression(right_side)
-            
-            if left_poly == right_poly:
-                return True, "rational", f"Cross-multiplication: {left_poly} = {right_poly}"
-            else:
-                return False, "rational", f"Cross-multiplication differs: {left_poly} ≠ {right_poly}"
-        except Exception as e:
-            return False, "rational", f"Could not normalize: {e}"
+        if left_poly == right_poly:
+            return True, "rational", f"Cross-multiplication: {left_poly} = {right_poly}"
+        else:
+            return False, "rational", f"Cross-multiplication differs: {left_poly} ≠ {right_poly}"
     
-    except Exception as e:
+    except ValueError as e:
         return False, "error", str(e)
+
+
+def group_equivalent(exprs: List[ASTNode]) -> List[int]:
+    """
+    Partition a batch of expressions into equivalence groups.
+    
+    Expressions are bucketed by their normalized polynomial (one hash per expression);
+    only an expression whose polynomial is new is compared against the existing groups'
+    representatives with are_equivalent, which catches structural and rational matches.
+    
+    Args:
+        exprs: Expression ASTs
+    
+    Returns:
+        A group id per expression; equal ids mean equivalent expressions
+    """
+    poly_groups: Dict[Polynomial, int] = {}
+    representatives: List[ASTNode] = []
+    group_ids = []
+    
+    for expr in exprs:
+        poly = expand_and_normalize(expr)
+        group = poly_groups.get(poly) if poly is not None else None
+        
+        if group is None:
+            group = next((i for i, rep in enumerate(representatives) if are_equivalent(expr, rep)), None)
+            if group is None:
+                group = len(representatives)
+                representatives.append(expr)
+            if poly is not None:
+                poly_groups[poly] = group
+        
+        group_ids.append(group)
+    
+    return group_ids
+
+
+def compile_reference(reference: ASTNode) -> Callable[[ASTNode], bool]:
+    """
+    Specialize are_equivalent for repeated checks against one fixed expression
+    (e.g. an answer key). The reference's fingerprint, polynomial and rational form
+    are computed once and bound into the returned checker, which runs the same
+    strategies as are_equivalent with the reference side already evaluated.
+    
+    Args:
+        reference: Reference expression AST
+    
+    Returns:
+        A function mapping an expression AST to True if it is equivalent to the reference
+    """
+    ref_poly = expand_and_normalize(reference)
+    ref_fingerprint = polynomial_fingerprint(reference) if ref_poly is not None else None
+    ref_rational = _rational_or_none(reference)
+    
+    def is_equivalent_to_reference(expr: ASTNode) -> bool:
+        if structurally_equal(expr, reference):
+            return True
+        
+        # Strategy 1: polynomial normalization
+        if ref_poly is not None:
+            try:
+                fingerprint = polynomial_fingerprint(expr)
+            except ValueError:
+                fingerprint = None
+            if fingerprint == ref_fingerprint and expand_and_normalize(expr) == ref_poly:
+                return True
+        
+        # Strategy 2: structural equality
+        if ast_equal(expr, reference):
+            return True
+        
+        # Strategy 3: rational form comparison
+        if ref_rational is None:
+            return False
+        rational = _rational_or_none(expr)
+        if rational is None:
+            return False
+        num, den = rational
+        ref_num, ref_den = ref_rational
+        if products_differ(num, ref_den, ref_num, den):
+            return False
+        return num * ref_den == ref_num * den
+    
+    return is_equivalent_to_reference
+
+
+def clear_caches() -> None:
+    """Drop every memoized AST, polynomial and comparison result (the caches are bounded; this frees them now)."""
+    for cached in (simplify_to_rational, _ast_equal_pair, _are_equivalent_pair,
+                   expand_and_normalize, _rational_or_none,
+                   polynomial.normalize_expression, polynomial.polynomial_fingerprint, polynomial.is_expandable,
+                   polynomial.Polynomial._combine_monomials, polynomial.ast_to_string, polynomial._term_bound,
+                   ast_nodes.canonical_form):
+        cached.cache_clear()
+    polynomial.AtomicExpr._cache.clear()
+    polynomial._NUMBER_POLYNOMIALS.clear()
+    polynomial._VARIABLE_POLYNOMIALS.clear()
@@ -3,12 +3,18 @@ Lexer (Lexical Analyzer) Module
 Tokenizes mathematical expressions, handling implicit multiplication.
 """
 
-from typing import List, Optional, NamedTuple
-from enum import Enum, auto
+import re
+import sys
+from typing import Any, List, Optional
+from enum import Enum, IntEnum, auto
 
 
-class TokenType(Enum):
-    """Token type enumeration."""
+class TokenType(IntEnum):
+    """
+    Token type enumeration.
+    An IntEnum, so hashing and comparing members (the implicit multiplication pair
+    lookups, the parser's precedence table) run in C instead of Enum's Python methods.
+    """
     NUMBER = auto()
     VARIABLE = auto()
     PLUS = auto()
@@ -21,13 +27,65 @@ class TokenType(Enum):
     RPAREN = auto()
     FUNCTION = auto()  # sin, cos, tan, ln, sqrt
     EOF = auto()
+    
+    # Keep Enum's "TokenType.NAME" text in error messages (IntEnum prints the number)
+    __str__ = Enum.__str__
+    __format__ = Enum.__format__
 
 
-class Token(NamedTuple):
+class Token:
     """Represents a single token."""
-    type: TokenType
-    value: any
-    pos: int
+    
+    __slots__ = ('type', 'value', 'pos')
+    
+    def __init__(self, type: TokenType, value: Any, pos: int):
+        self.type = type
+        self.value = value
+        self.pos = pos
+    
+    def __repr__(self) -> str:
+        return f"Token(type={self.type!r}, value={self.value!r}, pos={self.pos!r})"
+    
+    def __eq__(self, other):
+        return (isinstance(other, Token) and
+                self.type == other.type and
+                self.value == other.value and
+                self.pos == other.pos)
+    
+    def __hash__(self):
+        return hash((self.type, self.value, self.pos))
+
+
+# Master pattern: one alternative per character class, scanned by the C regex engine.
+# Letters follow str.isalpha (any Unicode letter), digits follow \d.
+# The alternatives start with disjoint character classes, so the scan never backtracks
+# and runs in linear time like a DFA; no third-party engine (re2, numba) is needed.
+_TOKEN_RE = re.compile(r'(\d+)|([^\W\d_]+)|([-+*/^()])|(\s+)|(.)', re.DOTALL)
+_NUMBER_GROUP, _IDENTIFIER_GROUP, _OPERATOR_GROUP, _WHITESPACE_GROUP, _INVALID_GROUP = 1, 2, 3, 4, 5
+
+_OPERATOR_TOKENS = {
+    '+': TokenType.PLUS,
+    '-': TokenType.MINUS,
+    '*': TokenType.MULTIPLY,
+    '/': TokenType.DIVIDE,
+    '^': TokenType.POWER,
+    '(': TokenType.LPAREN,
+    ')': TokenType.RPAREN,
+}
+
+# Token types hoisted to module constants for the tokenize loop
+_NUMBER = TokenType.NUMBER
+_VARIABLE = TokenType.VARIABLE
+_FUNCTION = TokenType.FUNCTION
+_IMPLICIT_MULTIPLY = TokenType.IMPLICIT_MULTIPLY
+
+# (previous, next) token type pairs that imply a multiplication between them
+_IMPLICIT_MULTIPLY_PAIRS = frozenset(
+    [(TokenType.NUMBER, nxt) for nxt in (TokenType.VARIABLE, TokenType.FUNCTION, TokenType.LPAREN)] +
+    [(prev, nxt)
+     for prev in (TokenType.VARIABLE, TokenType.RPAREN)
+     for nxt in (TokenType.VARIABLE, TokenType.FUNCTION, TokenType.LPAREN, TokenType.NUMBER)]
+)
 
 
 class Lexer:
@@ -42,119 +100,72 @@ class Lexer:
     
     def tokenize(self) -> List[Token]:
         """Convert expression string into list of tokens."""
-        while self.pos < len(self.expression):
-            self._skip_whitespace()
-            
-            if self.pos >= len(self.expression):
-                break
-            
-            ch = self.expression[self.pos]
+        append = self.tokens.append
+        
+        for match in _TOKEN_RE.finditer(self.expression):
+            kind = match.lastindex
+            start = match.start()
             
+            # Operators and delimiters (the most frequent class, tested first)
+            if kind == _OPERATOR_GROUP:
+                ch = match.group(kind)
+                append(Token(_OPERATOR_TOKENS[ch], ch, start))
             # Numbers
-            if ch.isdigit():
-                self._read_number()
+            elif kind == _NUMBER_GROUP:
+                append(Token(_NUMBER, int(match.group(kind)), start))
             # Variables or functions
-            elif ch.isalpha():
-                self._read_identifier()
-            # Operators and delimiters
-            elif ch == '+':
-                self.tokens.append(Token(TokenType.PLUS, '+', self.pos))
-                self.pos += 1
-            elif ch == '-':
-                self.tokens.append(Token(TokenType.MINUS, '-', self.pos))
-                self.pos += 1
-            elif ch == '*':
-                self.tokens.append(Token(TokenType.MULTIPLY, '*', self.pos))
-                self.pos += 1
-            elif ch == '/':
-                self.tokens.append(Token(TokenType.DIVIDE, '/', self.pos))
-                self.pos += 1
-            elif ch == '^':
-                self.tokens.append(Token(TokenType.POWER, '^', self.pos))
-                self.pos += 1
-            elif ch == '(':
-                self.tokens.append(Token(TokenType.LPAREN, '(', self.pos))
-                self.pos += 1
-            elif ch == ')':
-                self.tokens.append(Token(TokenType.RPAREN, ')', self.pos))
-                self.pos += 1
-            else:
-                raise ValueError(f"Unexpected character '{ch}' at position {self.pos}")
+            elif kind == _IDENTIFIER_GROUP:
+                self._read_identifier(match.group(kind), start)
+            elif kind == _INVALID_GROUP:
+                raise ValueError(f"Unexpected character '{match.group(kind)}' at position {start}")
         
+        self.pos = len(self.expression)
         self.tokens.append(Token(TokenType.EOF, None, self.pos))
         return self._handle_implicit_multiplication()
     
-    def _skip_whitespace(self):
-        """Skip whitespace characters."""
-        while self.pos < len(self.expression) and self.expression[self.pos].isspace():
-            self.pos += 1
-    
-    def _read_number(self):
-        """Read a numeric token."""
-        start = self.pos
-        while self.pos < len(self.expression) and self.expression[self.pos].isdigit():
-            self.pos += 1
-        value = int(self.expression[start:self.pos])
-        self.tokens.append(Token(TokenType.NUMBER, value, start))
-    
-    def _read_identifier(self):
-        """Read a variable or function token."""
-        start = self.pos
+    def _read_identifier(self, word: str, start: int):
+        """
+        Split a run of letters into variable and function tokens.
+        A function name is only recognized when it ends the run (so 'sine' is s*i*n*e);
+        every other letter is a single-letter variable, e.g. "xy" -> "x", "y".
+        """
+        if not word.isalpha():
+            # \w also admits numeric symbols such as superscripts
+            offset = next(i for i, ch in enumerate(word) if not ch.isalpha())
+            raise ValueError(f"Unexpected character '{word[offset]}' at position {start + offset}")
         
-        # Try to match function names first (multi-character)
-        for func_name in sorted(self.FUNCTIONS, key=len, reverse=True):
-            if self.expression[self.pos:].startswith(func_name):
-                # Check that it's not followed by another letter (to avoid matching 'sin' in 'sine')
-                end_pos = self.pos + len(func_name)
-                if end_pos >= len(self.expression) or not self.expression[end_pos].isalpha():
-                    self.tokens.append(Token(TokenType.FUNCTION, func_name, start))
-                    self.pos = end_pos
-                    return
+        # Fast path: a lone letter is always a variable (no function name is one letter)
+        if len(word) == 1:
+            self.tokens.append(Token(_VARIABLE, sys.intern(word), start))
+            return
         
-        # If not a function, treat as single-letter variable
-        # This allows consecutive variables like "xy" to be tokenized as "x" and "y"
-        identifier = self.expression[self.pos]
-        self.tokens.append(Token(TokenType.VARIABLE, identifier, start))
-        self.pos += 1
+        for offset in range(len(word)):
+            rest = word[offset:]
+            if rest in self.FUNCTIONS:
+                # Interned so every occurrence of a name shares one string object
+                self.tokens.append(Token(_FUNCTION, sys.intern(rest), start + offset))
+                return
+            self.tokens.append(Token(_VARIABLE, sys.intern(word[offset]), start + offset))
     
     def _handle_implicit_multiplication(self) -> List[Token]:
         """
         Insert IMPLICIT_MULTIPLY tokens for implicit multiplication.
-        The position is set to be between the two adjacent tokens.
+        The position is set to that of the token following the implied operator.
         Cases:
         - number followed by variable/function/lparen: 2x, 2sin(x), 2(x+1)
-        - variable/rparen followed by variable/function/lparen: x(y+1), xy, x sin(x)
+        - variable/rparen followed by variable/function/lparen/number: x(y+1), xy, x sin(x)
         """
         result = []
+        append = result.append
+        pairs = _IMPLICIT_MULTIPLY_PAIRS
+        prev_type = None
         
-        for i, token in enumerate(self.tokens):
-            result.append(token)
-            
-            if i < len(self.tokens) - 1:
-                next_token = self.tokens[i + 1]
-                
-                # Check if we need to insert implicit multiplication
-                should_insert_mult = False
-                
-                # Current token is NUMBER
-                if token.type == TokenType.NUMBER:
-                    if next_token.type in (TokenType.VARIABLE, TokenType.FUNCTION, TokenType.LPAREN):
-                        should_insert_mult = True
-                
-                # Current token is VARIABLE
-                elif token.type == TokenType.VARIABLE:
-                    if next_token.type in (TokenType.VARIABLE, TokenType.FUNCTION, TokenType.LPAREN, TokenType.NUMBER):
-                        should_insert_mult = True
-                
-                # Current token is RPAREN
-                elif token.type == TokenType.RPAREN:
-                    if next_token.type in (TokenType.VARIABLE, TokenType.FUNCTION, TokenType.LPAREN, TokenType.NUMBER):
-                        should_insert_mult = True
-                
-                if should_insert_mult:
-                    # Position is between current token end and next token start
-                    implicit_pos = token.pos + len(str(token.value)) if token.value else token.pos + 1
-                    result.append(Token(TokenType.IMPLICIT_MULTIPLY, '*', implicit_pos))
+        for token in self.tokens:
+            token_type = token.type
+            if (prev_type, token_type) in pairs:
+                append(Token(_IMPLICIT_MULTIPLY, '*', token.pos))
+            append(token)
+            prev_type = token_type
         
         return result
 
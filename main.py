@@ -3,11 +3,22 @@ Interactive Test Program
 Allows users to interactively test the mathematical expression analyzer.
 """
 
+import os
+import traceback
+
 from lexer import tokenize
-from parser import parse
-from ast_nodes import print_ast
+from parser import parse_cached, clear_parse_caches
+from ast_nodes import format_ast
 from polynomial import normalize_expression, is_expandable
-from equality import are_equivalent
+from equality import are_equivalent, group_equivalent, compile_reference, clear_caches
+
+
+# Set EXPR_DEBUG=1 to print full tracebacks for expression errors
+DEBUG = bool(os.environ.get("EXPR_DEBUG"))
+
+# Reference expression for repeated checks (menu options 5 and 6)
+_reference_expr = None
+_reference_check = None
 
 
 def print_menu():
@@ -19,6 +30,10 @@ def print_menu():
     print("  1. Analyze single expression (Lexer -> Parser -> Polynomial)")
     print("  2. Check equality of two expressions")
     print("  3. Exit")
+    print("  4. Group equivalent expressions (batch)")
+    print("  5. Set reference expression")
+    print("  6. Check expression against reference")
+    print("  7. Clear expression cache")
     print("-" * 70)
 
 
@@ -41,15 +56,15 @@ def analyze_single_expression():
         # Stage 1: Lexical Analysis
         print("\n[STAGE 1: LEXICAL ANALYSIS]")
         tokens = tokenize(expr)
-        print("Tokens:")
-        for token in tokens:
-            print(f"  {token.type.name:12} | value={repr(token.value):10} | pos={token.pos}")
+        lines = ["Tokens:"]
+        lines.extend(f"  {token.type.name:12} | value={repr(token.value):10} | pos={token.pos}"
+                     for token in tokens)
+        print("\n".join(lines))
         
         # Stage 2: Syntax Analysis (Parsing)
         print("\n[STAGE 2: SYNTAX ANALYSIS]")
-        ast = parse(expr)
-        print("Abstract Syntax Tree:")
-        print_ast(ast, indent=2)
+        ast = parse_cached(expr)
+        print("\n".join(format_ast(ast, 2, ["Abstract Syntax Tree:"])))
         
         # Stage 3: Polynomial Normalization
         print("\n[STAGE 3: POLYNOMIAL NORMALIZATION]")
@@ -61,8 +76,8 @@ def analyze_single_expression():
         
     except Exception as e:
         print(f"\nError: {e}")
-        import traceback
-        traceback.print_exc()
+        if DEBUG:
+            traceback.print_exc()
 
 
 def check_equality():
@@ -86,12 +101,12 @@ def check_equality():
     try:
         # Parse both expressions
         print("\n[Parsing Expression 1]")
-        ast1 = parse(expr1)
+        ast1 = parse_cached(expr1)
         poly1 = normalize_expression(ast1)
         print(f"Normalized: {poly1}")
         
         print("\n[Parsing Expression 2]")
-        ast2 = parse(expr2)
+        ast2 = parse_cached(expr2)
         poly2 = normalize_expression(ast2)
         print(f"Normalized: {poly2}")
         
@@ -108,8 +123,107 @@ def check_equality():
         
     except Exception as e:
         print(f"\nError: {e}")
-        import traceback
-        traceback.print_exc()
+        if DEBUG:
+            traceback.print_exc()
+
+
+def group_expressions():
+    """Read a batch of expressions and group the equivalent ones."""
+    print("\n" + "=" * 70)
+    print("  BATCH EQUIVALENCE GROUPING")
+    print("=" * 70)
+    print("\nEnter one expression per line (empty line to finish):")
+    
+    exprs = []
+    while True:
+        expr = input(f"  [{len(exprs) + 1}] ").strip()
+        if not expr:
+            break
+        exprs.append(expr)
+    
+    if not exprs:
+        print("Error: No expressions entered")
+        return
+    
+    try:
+        asts = [parse_cached(expr) for expr in exprs]
+        group_ids = group_equivalent(asts)
+        
+        print("-" * 70)
+        for group in range(max(group_ids) + 1):
+            members = [expr for expr, gid in zip(exprs, group_ids) if gid == group]
+            print(f"Group {group + 1}: " + "  ≡  ".join(members))
+        print("-" * 70)
+        
+    except Exception as e:
+        print(f"\nError: {e}")
+        if DEBUG:
+            traceback.print_exc()
+
+
+def set_reference():
+    """Set the reference expression used by option 6."""
+    global _reference_expr, _reference_check
+    
+    print("\n" + "=" * 70)
+    print("  SET REFERENCE EXPRESSION")
+    print("=" * 70)
+    
+    expr = input("\nEnter reference expression: ").strip()
+    
+    if not expr:
+        print("Error: Empty expression")
+        return
+    
+    try:
+        _reference_check = compile_reference(parse_cached(expr))
+        _reference_expr = expr
+        print(f"Reference set: {expr}")
+        
+    except Exception as e:
+        print(f"\nError: {e}")
+        if DEBUG:
+            traceback.print_exc()
+
+
+def check_against_reference():
+    """Check an expression against the current reference expression."""
+    print("\n" + "=" * 70)
+    print("  CHECK AGAINST REFERENCE")
+    print("=" * 70)
+    
+    if _reference_check is None:
+        print("\nError: No reference expression set (use option 5 first)")
+        return
+    
+    print(f"\nReference: {_reference_expr}")
+    expr = input("Enter expression: ").strip()
+    
+    if not expr:
+        print("Error: Empty expression")
+        return
+    
+    try:
+        is_equiv = _reference_check(parse_cached(expr))
+        
+        print("-" * 70)
+        if is_equiv:
+            print("✓ RESULT: The expression is EQUIVALENT to the reference")
+        else:
+            print("✗ RESULT: The expression is NOT EQUIVALENT to the reference")
+        print("-" * 70)
+        
+    except Exception as e:
+        print(f"\nError: {e}")
+        if DEBUG:
+            traceback.print_exc()
+
+
+def clear_expression_cache():
+    """Drop all cached parses and normalization results."""
+    clear_parse_caches()
+    clear_caches()
+    print("\nExpression cache cleared.")
 
 
 def main():
@@ -122,14 +236,14 @@ def main():
     print("  - Functions: sin, cos, tan, ln, sqrt")
     print("  - Variables: single letters (a-z, A-Z)")
     print("  - Implicit multiplication: 2x, xy, 2(x+1), etc.")
-    print("  - Polynomial expansion: (x+1)^2, (x+1)^3")
+    print("  - Polynomial expansion: (x+1)^2, (x+1)^3, ... up to (x+1)^16")
     print("  - Simple equality checking: 2x + y == y + 2 * x, 0 * x == 0, etc.")
     
     while True:
         print_menu()
         
         try:
-            choice = input("Enter your choice (1-3): ").strip()
+            choice = input("Enter your choice (1-7): ").strip()
             
             if choice == '1':
                 analyze_single_expression()
@@ -143,8 +257,20 @@ def main():
                 print("=" * 70)
                 break
             
+            elif choice == '4':
+                group_expressions()
+            
+            elif choice == '5':
+                set_reference()
+            
+            elif choice == '6':
+                check_against_reference()
+            
+            elif choice == '7':
+                clear_expression_cache()
+            
             else:
-                print("\nInvalid choice. Please enter 1, 2, or 3.")
+                print("\nInvalid choice. Please enter a number from 1 to 7.")
         
         except KeyboardInterrupt:
             print("\n\nInterrupted by user.")
@@ -155,7 +281,6 @@ def main():
         
         except Exception as e:
             print(f"\nUnexpected error: {e}")
-            import traceback
             traceback.print_exc()
 
 
@@ -1,6 +1,6 @@
 """
 Parser (Syntax Analyzer) Module
-Implements recursive descent parser with operator precedence.
+Implements a precedence-climbing parser driven by a binary operator table.
 Priority order (highest to lowest):
   1. Primary (numbers, variables, parentheses)
   2. Functions (sin, cos, tan, ln, sqrt)
@@ -15,15 +15,57 @@ Note: Unary minus has lower precedence than multiplication and power:
   - -2*x^2 is parsed as -(2*x^2), not (-2)*x^2
 """
 
-from typing import List, Optional
+from functools import lru_cache
+from typing import Dict, List, Optional
 from lexer import Token, TokenType, tokenize
 from ast_nodes import ASTNode, Number, Variable, BinOp, UnaryOp, FunctionCall
 
 
+# Binding strength of each binary operator token (higher binds tighter)
+_ADDITIVE_PRECEDENCE = 1
+_MULTIPLICATIVE_PRECEDENCE = 2
+_POWER_PRECEDENCE = 3
+
+_BINARY_PRECEDENCE = {
+    TokenType.PLUS: _ADDITIVE_PRECEDENCE,
+    TokenType.MINUS: _ADDITIVE_PRECEDENCE,
+    TokenType.MULTIPLY: _MULTIPLICATIVE_PRECEDENCE,
+    TokenType.IMPLICIT_MULTIPLY: _MULTIPLICATIVE_PRECEDENCE,
+    TokenType.DIVIDE: _MULTIPLICATIVE_PRECEDENCE,
+    TokenType.POWER: _POWER_PRECEDENCE,
+}
+
+# Token types hoisted to module constants for the hot loops (members are singletons,
+# so they are compared with `is`)
+_NUMBER = TokenType.NUMBER
+_VARIABLE = TokenType.VARIABLE
+_FUNCTION = TokenType.FUNCTION
+_LPAREN = TokenType.LPAREN
+_RPAREN = TokenType.RPAREN
+_MINUS = TokenType.MINUS
+_POWER = TokenType.POWER
+_IMPLICIT_MULTIPLY = TokenType.IMPLICIT_MULTIPLY
+_EOF = TokenType.EOF
+
+# Shared EOF sentinel appended to token lists that do not already end in one
+EOF_TOKEN = Token(TokenType.EOF, None, -1)
+
+# Strong caches for leaf nodes, consulted before the weak intern table in ast_nodes.
+# Names are interned by the lexer; only small integer constants and the first
+# _VARIABLE_CACHE_LIMIT variable names are kept, so neither cache grows without bound.
+_VARIABLE_CACHE: Dict[str, Variable] = {}
+_VARIABLE_CACHE_LIMIT = 256
+_NUMBER_CACHE: Dict[int, Number] = {}
+_NUMBER_CACHE_LIMIT = 256
+
+
 class Parser:
-    """Recursive descent parser for mathematical expressions."""
+    """Table-driven precedence-climbing parser for mathematical expressions."""
     
     def __init__(self, tokens: List[Token]):
+        # Guarantee the EOF sentinel the hot loops rely on (tokenize always emits one)
+        if not tokens or tokens[-1].type is not _EOF:
+            tokens = tokens + [EOF_TOKEN]
         self.tokens = tokens
         self.pos = 0
     
@@ -31,16 +73,15 @@ class Parser:
         """Parse tokens into an AST."""
         node = self._parse_expression()
         
-        if self.current_token().type != TokenType.EOF:
-            raise ValueError(f"Unexpected token: {self.current_token()}")
+        token = self.current_token()
+        if token.type is not _EOF:
+            raise ValueError(f"Unexpected token: {token}")
         
         return node
     
     def current_token(self) -> Token:
-        """Get current token."""
-        if self.pos < len(self.tokens):
-            return self.tokens[self.pos]
-        return self.tokens[-1]  # EOF
+        """Get current token (pos never moves past the trailing EOF, so no bounds check)."""
+        return self.tokens[self.pos]
     
     def peek_token(self, offset: int = 1) -> Token:
         """Look ahead at token."""
@@ -56,96 +97,126 @@ class Parser:
         if expected_type and token.type != expected_type:
             raise ValueError(f"Expected {expected_type}, got {token.type}")
         
-        self.pos += 1
+        # Stay on the EOF sentinel once it is reached
+        if token.type is not _EOF:
+            self.pos += 1
         return token
     
     def _parse_expression(self) -> ASTNode:
-        """Parse addition/subtraction (lowest precedence)."""
-        left = self._parse_unary()
-        
-        while self.current_token().type in (TokenType.PLUS, TokenType.MINUS):
-            op_token = self.consume()
-            right = self._parse_unary()
-            left = BinOp(left, op_token.value, right)
-        
-        return left
-    
-    def _parse_term(self) -> ASTNode:
-        """Parse multiplication/division (including implicit multiplication)."""
-        left = self._parse_power()
-        
-        while self.current_token().type in (TokenType.MULTIPLY, TokenType.IMPLICIT_MULTIPLY, TokenType.DIVIDE):
-            op_token = self.consume()
-            right = self._parse_power()
-            # Both MULTIPLY and IMPLICIT_MULTIPLY are treated as '*' in the AST
-            left = BinOp(left, '*' if op_token.type == TokenType.IMPLICIT_MULTIPLY else op_token.value, right)
-        
-        return left
+        """Parse a full expression: addition/subtraction level and everything below it."""
+        return self._parse_binary(_ADDITIVE_PRECEDENCE, allow_unary=True)
     
-    def _parse_power(self) -> ASTNode:
-        """Parse exponentiation (right-associative)."""
-        left = self._parse_function()
-        
-        if self.current_token().type == TokenType.POWER:
-            op_token = self.consume()
-            # Right-associative: a^b^c = a^(b^c)
-            # Unary minus has lower precedence than power, so we parse power first
-            right = self._parse_power()
-            return BinOp(left, op_token.value, right)
-        
-        return left
-    
-    def _parse_function(self) -> ASTNode:
-        """Parse function calls."""
-        # Handle functions
-        if self.current_token().type == TokenType.FUNCTION:
-            func_token = self.consume()
+    def _parse_binary(self, min_precedence: int, allow_unary: bool = False) -> ASTNode:
+        """
+        Precedence-climbing loop over the binary operator table.
+        Parses operators binding at least as tightly as min_precedence; one loop
+        iteration per operator replaces the old per-level chain of method calls.
+        """
+        tokens = self.tokens
+        
+        # Unary minus is only allowed at the start of an expression or right after
+        # a binary +/-, and applies to a whole multiplicative term: -x*y == -(x*y)
+        if allow_unary and tokens[self.pos].type is _MINUS:
+            self.pos += 1
+            left = UnaryOp('-', self._parse_binary(_MULTIPLICATIVE_PRECEDENCE))
+        else:
+            left = self._parse_atom()
+        
+        while True:
+            op_token = tokens[self.pos]
+            op_type = op_token.type
+            precedence = _BINARY_PRECEDENCE.get(op_type)
+            if precedence is None or precedence < min_precedence:
+                return left
+            self.pos += 1
             
-            # Function must be followed by primary expression or parenthesized expression
-            arg = self._parse_primary()
-            return FunctionCall(func_token.value, arg)
-        
-        return self._parse_primary()
-    
-    def _parse_unary(self) -> ASTNode:
-        """Parse unary minus (lower precedence than multiplication and power)."""
-        # Handle unary minus
-        if self.current_token().type == TokenType.MINUS:
-            self.consume()
-            # Unary minus has lower precedence than multiplication and power
-            # So -x^2 should be parsed as -(x^2), not (-x)^2
-            # And -x*y should be parsed as -(x*y), not (-x)*y
-            operand = self._parse_term()
-            return UnaryOp('-', operand)
-        
-        return self._parse_term()
+            if op_type is _POWER:
+                # Right-associative: a^b^c = a^(b^c); no unary minus in exponents
+                right = self._parse_binary(precedence)
+            else:
+                # Left-associative; after +/- a unary minus may start the next term
+                right = self._parse_binary(precedence + 1, allow_unary=(precedence == _ADDITIVE_PRECEDENCE))
+            
+            # Both MULTIPLY and IMPLICIT_MULTIPLY are treated as '*' in the AST
+            left = BinOp(left, '*' if op_type is _IMPLICIT_MULTIPLY else op_token.value, right)
     
-    def _parse_primary(self) -> ASTNode:
-        """Parse primary expressions: numbers, variables, and parenthesized expressions."""
-        token = self.current_token()
+    def _parse_atom(self) -> ASTNode:
+        """
+        Parse an operand: a number, variable or parenthesized expression,
+        optionally preceded by a function name applied to it.
+        """
+        tokens = self.tokens
+        token = tokens[self.pos]
+        
+        # Function must be followed by primary expression or parenthesized expression
+        func_token = None
+        if token.type is _FUNCTION:
+            func_token = token
+            self.pos += 1
+            token = tokens[self.pos]
+        
+        token_type = token.type
         
         # Numbers
-        if token.type == TokenType.NUMBER:
-            self.consume()
-            return Number(token.value)
+        if token_type is _NUMBER:
+            self.pos += 1
+            node = _NUMBER_CACHE.get(token.value)
+            if node is None:
+                node = Number(token.value)
+                if token.value < _NUMBER_CACHE_LIMIT:
+                    _NUMBER_CACHE[token.value] = node
         
         # Variables
-        if token.type == TokenType.VARIABLE:
-            self.consume()
-            return Variable(token.value)
+        elif token_type is _VARIABLE:
+            self.pos += 1
+            node = _VARIABLE_CACHE.get(token.value)
+            if node is None:
+                node = Variable(token.value)
+                if len(_VARIABLE_CACHE) < _VARIABLE_CACHE_LIMIT:
+                    _VARIABLE_CACHE[token.value] = node
         
         # Parenthesized expression
-        if token.type == TokenType.LPAREN:
-            self.consume()
-            expr = self._parse_expression()
-            self.consume(TokenType.RPAREN)
-            return expr
-        
-        raise ValueError(f"Unexpected token in primary: {token}")
+        elif token_type is _LPAREN:
+            self.pos += 1
+            node = self._parse_expression()
+            # Inlined consume(RPAREN): the closing token is always in range (EOF at worst)
+            closing_type = tokens[self.pos].type
+            if closing_type is not _RPAREN:
+                raise ValueError(f"Expected {TokenType.RPAREN}, got {closing_type}")
+            self.pos += 1
+        
+        else:
+            raise ValueError(f"Unexpected token in primary: {token}")
+        
+        if func_token is not None:
+            return FunctionCall(func_token.value, node)
+        return node
 
 
 def parse(expression: str) -> ASTNode:
     """Convenience function to parse an expression string."""
-    tokens = tokenize(expression)
-    parser = Parser(tokens)
-    return parser.parse()
+    return parse_tokens(tokenize(expression))
+
+
+def parse_tokens(tokens: List[Token]) -> ASTNode:
+    """
+    Parse an already tokenized expression (as returned by tokenize).
+    The token list is only read, so one tokenization can be shared by several callers.
+    """
+    return Parser(tokens).parse()
+
+
+@lru_cache(maxsize=2048)
+def parse_cached(expression: str) -> ASTNode:
+    """
+    parse() memoized on the source string.
+    Safe to share results because AST nodes are immutable and interned.
+    """
+    return parse(expression)
+
+
+def clear_parse_caches() -> None:
+    """Drop the memoized parses and the strong leaf-node caches."""
+    parse_cached.cache_clear()
+    _VARIABLE_CACHE.clear()
+    _NUMBER_CACHE.clear()
@@ -4,21 +4,39 @@ Converts expressions containing only +, -, * operations into a canonical polynom
 Non-expandable subexpressions (containing /, ^, functions) are treated as atomic variables.
 """
 
-from typing import Dict, Tuple, Set, Optional
-from ast_nodes import ASTNode, Number, Variable, BinOp, UnaryOp, FunctionCall
+import math
+import weakref
+from functools import lru_cache
+from typing import Any, Dict, Tuple, Set, Optional
+from ast_nodes import (ASTNode, Number, Variable, BinOp, UnaryOp, FunctionCall, MEMO_CACHE_SIZE,
+                       KIND_NUMBER, KIND_VARIABLE, KIND_BINOP, KIND_UNARYOP, KIND_FUNCTION_CALL)
 
 
 class AtomicExpr:
     """Represents a non-expandable atomic expression."""
     
+    __slots__ = ('node', 'expr_str', 'id', '_hash', '__weakref__')
+    
     _counter = 0
-    _cache: Dict[str, 'AtomicExpr'] = {}
+    # Weak, like the AST intern table: an atom (and the node it holds) lives only as
+    # long as some polynomial still refers to it
+    _cache: 'weakref.WeakValueDictionary[str, AtomicExpr]' = weakref.WeakValueDictionary()
     
     def __init__(self, ast_node: ASTNode, expr_str: str):
         self.node = ast_node
         self.expr_str = expr_str
         self.id = AtomicExpr._counter
         AtomicExpr._counter += 1
+        # Hashed inside every monomial key it appears in, so computed once up front
+        self._hash = hash(('AtomicExpr', expr_str))
+    
+    @classmethod
+    def get(cls, ast_node: ASTNode, expr_str: str) -> 'AtomicExpr':
+        """Return the shared instance for expr_str, creating it on first use."""
+        atomic = cls._cache.get(expr_str)
+        if atomic is None:
+            atomic = cls._cache[expr_str] = cls(ast_node, expr_str)
+        return atomic
     
     def __repr__(self) -> str:
         # Return the expression string directly without Atom() wrapper
@@ -28,10 +46,11 @@ class AtomicExpr:
         return self.expr_str
     
     def __eq__(self, other):
-        return isinstance(other, AtomicExpr) and self.expr_str == other.expr_str
+        # Instances are shared through get(), so identity settles the common case
+        return self is other or (isinstance(other, AtomicExpr) and self.expr_str == other.expr_str)
     
     def __hash__(self):
-        return hash(('AtomicExpr', self.expr_str))
+        return self._hash
     
     def __lt__(self, other):
         """Enable sorting of AtomicExpr objects."""
@@ -49,33 +68,61 @@ class AtomicExpr:
         return not self < other
 
 
+# Largest constant exponent that is expanded; higher powers stay atomic so that
+# inputs like (x+y+z)^1000 cannot blow up the number of terms
+MAX_EXPANDED_EXPONENT = 16
+
+# Largest estimated number of terms an expanded power may have. Nested powers and
+# many-variable bases such as ((x+y+z)^16)^16 or (a+b+c+d+e+f)^16 stay atomic.
+MAX_EXPANDED_TERMS = 1024
+
+# Monomial key of the constant term
+_CONSTANT_MONOMIAL = ()
+
+
 class Polynomial:
     """
     Represents a polynomial as a sum of monomials.
     Stored as a dictionary: {monomial: coefficient}
-    where monomial is a frozenset of (variable_name, power) tuples.
+    where monomial is a tuple of (variable_name, power) pairs sorted by variable.
     Variables can be regular variables (str) or atomic expressions.
     """
     
+    # Many short-lived intermediates are built during expansion
+    __slots__ = ('terms', '_hash', '_fingerprint', '_repr')
+    
     def __init__(self, terms: Optional[Dict] = None):
         """
         Initialize polynomial.
-        terms: dict mapping frozenset of (var, power) tuples to coefficient
+        terms: dict mapping sorted tuples of (var, power) pairs to coefficient;
+               the polynomial takes ownership of it (callers pass a fresh dict)
         """
-        self.terms: Dict[frozenset, int] = terms if terms else {}
+        self.terms: Dict[Tuple[Tuple[Any, int], ...], int] = terms if terms else {}
         self._normalize()
+        self._hash: Optional[int] = None  # computed lazily by __hash__
+        self._fingerprint: Optional[int] = None  # computed lazily by fingerprint
+        self._repr: Optional[str] = None  # rendered lazily by __repr__
     
     def _normalize(self):
         """Remove zero terms."""
-        self.terms = {m: c for m, c in self.terms.items() if c != 0}
+        # Most results have no cancelled terms: one scan in C instead of a dict rebuild
+        if 0 in self.terms.values():
+            self.terms = {m: c for m, c in self.terms.items() if c != 0}
     
     def __repr__(self) -> str:
+        # Terms are final after __init__, so the rendering is built once
+        if self._repr is None:
+            self._repr = self._render()
+        return self._repr
+    
+    def _render(self) -> str:
         if not self.terms:
             return "0"
         
         parts = []
         first = True
-        for monomial, coeff in sorted(self.terms.items(), key=lambda x: str(x)):
+        # Plain tuple order: the constant term () sorts first, then monomials by variable
+        for monomial, coeff in sorted(self.terms.items()):
             if coeff == 0:
                 continue
             
@@ -96,7 +143,7 @@ class Polynomial:
         return "".join(parts) if parts else "0"
     
     @staticmethod
-    def _format_monomial(monomial: frozenset, coeff: int) -> str:
+    def _format_monomial(monomial: tuple, coeff: int) -> str:
         """Format a monomial for display with proper parentheses."""
         if not monomial:  # Constant term
             return str(coeff)
@@ -104,7 +151,7 @@ class Polynomial:
         # Format each variable with its power
         var_parts = []
         has_power = False
-        for var, power in sorted(monomial):
+        for var, power in monomial:  # already sorted by variable
             if power > 1:
                 var_parts.append(f"{var}^{power}")
                 has_power = True
@@ -134,104 +181,331 @@ class Polynomial:
                 return f"{coeff}*{vars_str}"
     
     def __eq__(self, other):
+        if self is other:
+            return True
         if not isinstance(other, Polynomial):
             return False
+        # Cheap rejections first: term count, then the cached hash
+        if len(self.terms) != len(other.terms) or hash(self) != hash(other):
+            return False
         return self.terms == other.terms
     
+    def __hash__(self):
+        # Polynomials are treated as immutable once built, so the hash is cached.
+        # XOR-folding the term hashes makes it independent of dict order.
+        if self._hash is None:
+            h = 0
+            for term in self.terms.items():
+                h ^= hash(term)
+            self._hash = h
+        return self._hash
+    
+    def fingerprint(self) -> int:
+        """
+        Evaluate the polynomial modulo _FINGERPRINT_MOD at the same pseudo-random point
+        as polynomial_fingerprint. Evaluation respects + and *, so products of polynomials
+        can be compared through their fingerprints without being multiplied out.
+        """
+        if self._fingerprint is None:
+            self._fingerprint = self._evaluate_fingerprint()
+        return self._fingerprint
+    
+    def _evaluate_fingerprint(self) -> int:
+        mod = _FINGERPRINT_MOD
+        variables = {var for monomial in self.terms for var, _ in monomial}
+        
+        if len(variables) == 1:
+            point = _variable_fingerprint(variables.pop())
+            coeffs = {}
+            for monomial, coeff in self.terms.items():
+                power = next(iter(monomial))[1] if monomial else 0
+                coeffs[power] = coeff
+            degree = max(coeffs)
+            if degree <= _HORNER_DENSITY * len(coeffs):
+                # Dense univariate: Horner's rule over the coefficient list, O(degree)
+                acc = 0
+                for power in range(degree, -1, -1):
+                    acc = (acc * point + coeffs.get(power, 0)) % mod
+                return acc
+            # Sparse (e.g. x^4096): one modular power per term, O(terms * log(degree))
+            return sum(coeff * pow(point, power, mod) for power, coeff in coeffs.items()) % mod
+        
+        points = {var: _variable_fingerprint(var) for var in variables}
+        acc = 0
+        for monomial, coeff in self.terms.items():
+            value = coeff
+            for var, power in monomial:
+                value = value * pow(points[var], power, mod) % mod
+            acc += value
+        return acc % mod
+    
     def __add__(self, other: 'Polynomial') -> 'Polynomial':
         """Add two polynomials."""
-        result = dict(self.terms)
-        for monomial, coeff in other.terms.items():
-            result[monomial] = result.get(monomial, 0) + coeff
+        # Adding zero returns the other operand (polynomials are not mutated once built)
+        if not other.terms:
+            return self
+        if not self.terms:
+            return other
+        
+        # Copy the larger dict in C and merge the smaller one in Python
+        base, extra = self.terms, other.terms
+        if len(extra) > len(base):
+            base, extra = extra, base
+        result = dict(base)
+        get = result.get
+        for monomial, coeff in extra.items():
+            result[monomial] = get(monomial, 0) + coeff
         return Polynomial(result)
     
     def __sub__(self, other: 'Polynomial') -> 'Polynomial':
         """Subtract two polynomials."""
+        if not other.terms:
+            return self
+        if not self.terms:
+            return -other
+        
         result = dict(self.terms)
+        get = result.get
         for monomial, coeff in other.terms.items():
-            result[monomial] = result.get(monomial, 0) - coeff
+            result[monomial] = get(monomial, 0) - coeff
         return Polynomial(result)
     
     def __mul__(self, other: 'Polynomial') -> 'Polynomial':
         """Multiply two polynomials."""
+        # Constant factors (e.g. the unit denominators of rational forms) only scale
+        # the coefficients, so the pairwise monomial products are skipped
+        constant = other._constant_value()
+        if constant is not None:
+            return self._scaled(constant)
+        constant = self._constant_value()
+        if constant is not None:
+            return other._scaled(constant)
+        
+        # Hot double loop: bind the method lookups to locals once
         result = {}
+        get = result.get
+        combine = Polynomial._combine_monomials
+        other_items = list(other.terms.items())
         for m1, c1 in self.terms.items():
-            for m2, c2 in other.terms.items():
-                # Combine monomials
-                combined = self._combine_monomials(m1, m2)
-                coeff = c1 * c2
-                result[combined] = result.get(combined, 0) + coeff
+            for m2, c2 in other_items:
+                combined = combine(m1, m2)
+                result[combined] = get(combined, 0) + c1 * c2
+        return Polynomial(result)
+    
+    def _constant_value(self) -> Optional[int]:
+        """The coefficient if the polynomial is a single constant term, else None."""
+        if len(self.terms) == 1:
+            return self.terms.get(_CONSTANT_MONOMIAL)
+        return None
+    
+    def _scaled(self, factor: int) -> 'Polynomial':
+        """Multiply every coefficient by an integer factor."""
+        if factor == 1:
+            return self  # polynomials are not mutated once built
+        return Polynomial({m: c * factor for m, c in self.terms.items()})
+    
+    def square(self) -> 'Polynomial':
+        """
+        Square the polynomial: (sum c_i*m_i)^2 = sum c_i^2*m_i^2 + sum_{i<j} 2*c_i*c_j*m_i*m_j.
+        Each cross product is computed once instead of twice as in self * self.
+        """
+        items = list(self.terms.items())
+        result = {}
+        get = result.get
+        combine = Polynomial._combine_monomials
+        for i, (m1, c1) in enumerate(items):
+            # Diagonal term: double every exponent of the monomial
+            squared = tuple([(var, power * 2) for var, power in m1])
+            result[squared] = get(squared, 0) + c1 * c1
+            doubled = 2 * c1
+            for m2, c2 in items[i + 1:]:
+                combined = combine(m1, m2)
+                result[combined] = get(combined, 0) + doubled * c2
         return Polynomial(result)
     
+    def __pow__(self, exponent: int) -> 'Polynomial':
+        """
+        Raise the polynomial to a non-negative integer power by repeated squaring:
+        O(log n) products instead of n - 1, e.g. x^8 takes three squarings.
+        """
+        if exponent < 0:
+            raise ValueError(f"Unsupported polynomial exponent: {exponent}")
+        result = None
+        factor = self
+        while exponent:
+            if exponent & 1:
+                result = factor if result is None else result * factor
+            exponent >>= 1
+            if exponent:
+                factor = factor.square()
+        return result if result is not None else Polynomial({(): 1})
+    
     @staticmethod
-    def _combine_monomials(m1: frozenset, m2: frozenset) -> frozenset:
-        """Multiply two monomials."""
-        # Convert to dict for easier manipulation
-        vars_dict = {}
-        for var, power in m1:
-            vars_dict[var] = vars_dict.get(var, 0) + power
-        for var, power in m2:
-            vars_dict[var] = vars_dict.get(var, 0) + power
+    @lru_cache(maxsize=1 << 16)
+    def _combine_monomials(m1: tuple, m2: tuple) -> tuple:
+        """
+        Multiply two monomials.
+        Memoized: expansions multiply the same few monomials over and over, and
+        monomial tuples hash cheaply, so a lookup is much cheaper than a rebuild.
+        """
+        # A constant monomial is the identity: skip rebuilding the key
+        if not m1:
+            return m2
+        if not m2:
+            return m1
         
-        return frozenset(vars_dict.items())
+        # Both monomials are sorted by variable: merge them in one linear pass
+        result = []
+        i = j = 0
+        n1, n2 = len(m1), len(m2)
+        while i < n1 and j < n2:
+            var1, power1 = m1[i]
+            var2, power2 = m2[j]
+            if var1 == var2:
+                result.append((var1, power1 + power2))
+                i += 1
+                j += 1
+            elif var1 < var2:
+                result.append(m1[i])
+                i += 1
+            else:
+                result.append(m2[j])
+                j += 1
+        result.extend(m1[i:])
+        result.extend(m2[j:])
+        return tuple(result)
     
     def __neg__(self) -> 'Polynomial':
         """Negate polynomial."""
         return Polynomial({m: -c for m, c in self.terms.items()})
 
 
+@lru_cache(maxsize=MEMO_CACHE_SIZE)
 def is_expandable(node: ASTNode) -> bool:
-    """Check if node contains only +, -, * operations."""
-    if isinstance(node, (Number, Variable)):
-        return True
-    elif isinstance(node, UnaryOp):
-        return node.op == '-' and is_expandable(node.operand)
-    elif isinstance(node, BinOp):
-        return node.op in ('+', '-', '*') and is_expandable(node.left) and is_expandable(node.right)
-    else:
-        return False
+    """
+    Check if node contains only +, -, * operations.
+    Walks an explicit stack and stops at the first other node; memoized per
+    (hash-consed) node.
+    """
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        kind = current._kind
+        if kind == KIND_BINOP:
+            if current.op not in ('+', '-', '*'):
+                return False
+            stack.append(current.right)
+            stack.append(current.left)
+        elif kind == KIND_UNARYOP:
+            if current.op != '-':
+                return False
+            stack.append(current.operand)
+        elif kind != KIND_NUMBER and kind != KIND_VARIABLE:
+            return False
+    return True
 
 
+@lru_cache(maxsize=MEMO_CACHE_SIZE)
 def ast_to_string(node: ASTNode, parent_op: str = None, is_right_of_power: bool = False) -> str:
-    """Convert AST node to string representation with minimal parentheses."""
-    if isinstance(node, Number):
-        return str(node.value)
-    elif isinstance(node, Variable):
-        return node.name
-    elif isinstance(node, BinOp):
-        # For power operator (right-associative), add parentheses to right operand if it's also a power
-        if node.op == '^':
-            left_str = ast_to_string(node.left, node.op, False)
-            right_str = ast_to_string(node.right, node.op, True)
-            
-            # If right operand is also a power operation, add parentheses
-            if isinstance(node.right, BinOp) and node.right.op == '^':
-                right_str = f"({right_str})"
-            
-            result = f"{left_str}^{right_str}"
-        else:
-            left_str = ast_to_string(node.left, node.op, False)
-            right_str = ast_to_string(node.right, node.op, False)
-            result = f"{left_str}{node.op}{right_str}"
-        
-        # Add outer parentheses only if this is a subexpression of a higher precedence operation
-        if parent_op and needs_parens(node.op, parent_op):
-            result = f"({result})"
-        
-        return result
-    elif isinstance(node, UnaryOp):
-        operand_str = ast_to_string(node.operand, node.op, False)
-        return f"{node.op}{operand_str}"
-    elif isinstance(node, FunctionCall):
-        arg_str = ast_to_string(node.arg, None, False)
-        return f"{node.func_name}({arg_str})"
-    else:
-        return str(node)
+    """
+    Convert AST node to string representation with minimal parentheses.
+    Memoized per (hash-consed) node, so shared subtrees and repeated atomic
+    wrappers of the same subexpression are rendered once.
+    """
+    return _parenthesize(node, _render_subtree(node), parent_op)
+
+
+def _render_subtree(root: ASTNode) -> str:
+    """
+    Render a tree without outer parentheses using an explicit stack (post-order),
+    so deep power/division chains are not limited by the recursion limit.
+    """
+    rendered = {}  # id(node) -> text; the tree keeps every node alive during the walk
+    stack = [(root, False)]
+    while stack:
+        node, ready = stack.pop()
+        key = id(node)
+        if key in rendered:
+            continue
+        children = _string_operands(node)
+        if children and not ready:
+            # Revisit this node once its operands are rendered
+            stack.append((node, True))
+            stack.extend([(child, False) for child in children])
+            continue
+        rendered[key] = _RENDER[node._kind](node, rendered)
+    return rendered[id(root)]
+
+
+def _string_operands(node: ASTNode) -> tuple:
+    kind = node._kind
+    if kind == KIND_BINOP:
+        return (node.left, node.right)
+    if kind == KIND_UNARYOP:
+        return (node.operand,)
+    if kind == KIND_FUNCTION_CALL:
+        return (node.arg,)
+    return ()
+
+
+def _parenthesize(node: ASTNode, text: str, parent_op: Optional[str]) -> str:
+    """Add outer parentheses only if this is a subexpression of a higher precedence operation."""
+    if parent_op and node._kind == KIND_BINOP and needs_parens(node.op, parent_op):
+        return f"({text})"
+    return text
+
+
+def _render_number(node: Number, rendered: dict) -> str:
+    return str(node.value)
+
+
+def _render_variable(node: Variable, rendered: dict) -> str:
+    return node.name
+
+
+def _render_binop(node: BinOp, rendered: dict) -> str:
+    op = node.op
+    left_str = _parenthesize(node.left, rendered[id(node.left)], op)
+    right_str = _parenthesize(node.right, rendered[id(node.right)], op)
+    
+    # For power operator (right-associative), add parentheses to right operand if it's also a power
+    if op == '^':
+        if node.right._kind == KIND_BINOP and node.right.op == '^':
+            right_str = f"({right_str})"
+        return f"{left_str}^{right_str}"
+    return f"{left_str}{op}{right_str}"
+
+
+def _render_unary(node: UnaryOp, rendered: dict) -> str:
+    operand_str = _parenthesize(node.operand, rendered[id(node.operand)], node.op)
+    return f"{node.op}{operand_str}"
+
+
+def _render_function(node: FunctionCall, rendered: dict) -> str:
+    return f"{node.func_name}({rendered[id(node.arg)]})"
+
+
+def _render_unknown(node: ASTNode, rendered: dict) -> str:
+    return str(node)
+
+
+# Indexed by node._kind
+_RENDER = (
+    _render_number,
+    _render_variable,
+    _render_binop,
+    _render_unary,
+    _render_function,
+    _render_unknown,
+)
+
+# Binding strength of each binary operator, for parenthesization
+_PRECEDENCE = {'+': 1, '-': 1, '*': 2, '/': 2, '^': 3}
 
 
 def needs_parens(op: str, parent_op: str) -> bool:
     """Check if operation needs parentheses based on parent operation."""
-    precedence = {'+': 1, '-': 1, '*': 2, '/': 2, '^': 3}
+    precedence = _PRECEDENCE
     
     if op not in precedence or parent_op not in precedence:
         return False
@@ -245,92 +519,336 @@ def expand_to_polynomial(node: ASTNode) -> Polynomial:
     Convert an expandable AST to a polynomial.
     Non-expandable subexpressions become atomic variables.
     """
-    if isinstance(node, Number):
-        # Constant term
-        if node.value == 0:
-            return Polynomial()
-        return Polynomial({frozenset(): node.value})
+    return _fold_expansion(node, _EXPAND)
+
+
+def _fold_expansion(node: ASTNode, handlers: tuple) -> Any:
+    """
+    Combine the results of an expansion bottom-up with one handler per node kind
+    (indexed by node._kind), each given the node and its operands' results.
+    """
+    # Iterative post-order walk: a node is expanded once all its operands have results,
+    # so deep inputs are bounded by memory rather than by the recursion limit.
+    # Results are keyed by id() (the tree keeps every node alive during the walk), and
+    # interned subtrees that repeat are looked up there instead of revisited.
+    results = {}
+    stack = [(node, None)]
+    while stack:
+        current, operands = stack.pop()
+        key = id(current)
+        if operands is None:
+            if key in results:
+                continue
+            operands = _expansion_operands(current)
+            if operands:
+                # Revisit this node after its operands
+                stack.append((current, operands))
+                stack.extend([(child, None) for child in operands])
+                continue
+        results[key] = handlers[current._kind](current, *[results[id(child)] for child in operands])
     
-    elif isinstance(node, Variable):
+    return results[id(node)]
+
+
+def _expansion_operands(node: ASTNode) -> tuple:
+    """Children whose polynomials are combined to build this node's polynomial."""
+    kind = node._kind
+    if kind == KIND_BINOP:
+        op = node.op
+        if op in ('+', '-', '*'):
+            return (node.left, node.right)
+        if op == '^' and _expands_power(node):
+            # Only the base of an expanded power is needed; other powers are atomic
+            return (node.left,)
+        return ()
+    if kind == KIND_UNARYOP and node.op == '-':
+        return (node.operand,)
+    return ()
+
+
+def _expands_power(node: BinOp) -> bool:
+    """
+    True if expand_to_polynomial multiplies out the power node: the exponent is a
+    constant from 1 to MAX_EXPANDED_EXPONENT and the estimated number of terms of the
+    result stays within MAX_EXPANDED_TERMS. Decided on the AST alone, so expansion and
+    fingerprinting always treat a power the same way.
+    """
+    exponent = node.right
+    if exponent._kind != KIND_NUMBER or not 1 <= exponent.value <= MAX_EXPANDED_EXPONENT:
+        return False
+    return (exponent.value == 1 or
+            _power_term_bound(_term_bound(node.left), exponent.value) <= MAX_EXPANDED_TERMS)
+
+
+def _power_term_bound(base_terms: int, exponent: int) -> int:
+    """Most terms p^n can have when p has base_terms terms: multisets of n of them."""
+    return math.comb(base_terms + exponent - 1, exponent)
+
+
+@lru_cache(maxsize=MEMO_CACHE_SIZE)
+def _term_bound(node: ASTNode) -> int:
+    """
+    Upper bound on the number of terms of the expression's normalized polynomial,
+    computed over the same operands as the expansion without multiplying anything out.
+    """
+    return _fold_expansion(node, _TERM_BOUND)
+
+
+def _bound_leaf(node: ASTNode) -> int:
+    # Constants, variables and atomic subexpressions are single terms
+    return 1
+
+
+def _bound_unary(node: UnaryOp, operand: int = 1) -> int:
+    return operand
+
+
+def _bound_binop(node: BinOp, *operands: int) -> int:
+    op = node.op
+    if op == '+' or op == '-':
+        left, right = operands
+        return left + right
+    if op == '*':
+        left, right = operands
+        return left * right
+    if op == '^' and operands:
+        return _power_term_bound(operands[0], node.right.value)
+    # Atomic powers and quotients
+    return 1
+
+
+# Indexed by node._kind
+_TERM_BOUND = (
+    _bound_leaf,
+    _bound_leaf,
+    _bound_binop,
+    _bound_unary,
+    _bound_leaf,
+    _bound_leaf,
+)
+
+
+def _atomic_polynomial(node: ASTNode) -> Polynomial:
+    """A non-expandable subexpression as a single atomic variable."""
+    atomic = AtomicExpr.get(node, ast_to_string(node))
+    return Polynomial({((atomic, 1),): 1})
+
+
+# Shared leaf polynomials (safe because polynomials are not mutated once built).
+# Only small constants and the first few variable names are kept, so both stay bounded.
+_NUMBER_POLYNOMIALS: Dict[int, Polynomial] = {}
+_VARIABLE_POLYNOMIALS: Dict[str, Polynomial] = {}
+_LEAF_CACHE_LIMIT = 256
+
+
+def _expand_number(node: Number) -> Polynomial:
+    poly = _NUMBER_POLYNOMIALS.get(node.value)
+    if poly is None:
+        # Constant term (zero is the empty polynomial)
+        poly = Polynomial({(): node.value} if node.value else None)
+        if node.value < _LEAF_CACHE_LIMIT:
+            _NUMBER_POLYNOMIALS[node.value] = poly
+    return poly
+
+
+def _expand_variable(node: Variable) -> Polynomial:
+    poly = _VARIABLE_POLYNOMIALS.get(node.name)
+    if poly is None:
         # Single variable with power 1
-        return Polynomial({frozenset([(node.name, 1)]): 1})
+        poly = Polynomial({((node.name, 1),): 1})
+        if len(_VARIABLE_POLYNOMIALS) < _LEAF_CACHE_LIMIT:
+            _VARIABLE_POLYNOMIALS[node.name] = poly
+    return poly
+
+
+def _expand_unary(node: UnaryOp, operand: Optional[Polynomial] = None) -> Polynomial:
+    if node.op == '-':
+        return -operand
+    else:
+        raise ValueError(f"Unsupported unary operator: {node.op}")
+
+
+def _expand_binop(node: BinOp, *operands: Polynomial) -> Polynomial:
+    if node.op == '+':
+        left, right = operands
+        return left + right
     
-    elif isinstance(node, UnaryOp):
-        if node.op == '-':
-            return -expand_to_polynomial(node.operand)
-        else:
-            raise ValueError(f"Unsupported unary operator: {node.op}")
+    elif node.op == '-':
+        left, right = operands
+        return left - right
+    
+    elif node.op == '*':
+        left, right = operands
+        return left * right
     
-    elif isinstance(node, BinOp):
-        if node.op == '+':
-            left = expand_to_polynomial(node.left)
-            right = expand_to_polynomial(node.right)
-            return left + right
+    elif node.op == '^':
+        # Handle power with special cases
         
-        elif node.op == '-':
-            left = expand_to_polynomial(node.left)
-            right = expand_to_polynomial(node.right)
-            return left - right
+        # Special case 1: x^0 = 1 (anything to the power 0 is 1)
+        if node.right._kind == KIND_NUMBER and node.right.value == 0:
+            return Polynomial({(): 1})  # Return 1
         
-        elif node.op == '*':
-            left = expand_to_polynomial(node.left)
-            right = expand_to_polynomial(node.right)
-            return left * right
+        # Special case 2: x^1 = x (anything to the power 1 is itself)
+        if node.right._kind == KIND_NUMBER and node.right.value == 1:
+            return operands[0]
         
-        elif node.op == '^':
-            # Handle power with special cases
-            
-            # Special case 1: x^0 = 1 (anything to the power 0 is 1)
-            if isinstance(node.right, Number) and node.right.value == 0:
-                return Polynomial({frozenset(): 1})  # Return 1
-            
-            # Special case 2: x^1 = x (anything to the power 1 is itself)
-            if isinstance(node.right, Number) and node.right.value == 1:
-                return expand_to_polynomial(node.left)
-            
-            # Special case 3: 0^x = 0 (zero to any positive power is 0)
-            if isinstance(node.left, Number) and node.left.value == 0:
-                return Polynomial()  # Return 0
-            
-            # Special case 4: 1^x = 1 (one to any power is 1)
-            if isinstance(node.left, Number) and node.left.value == 1:
-                return Polynomial({frozenset(): 1})  # Return 1
-            
-            # Handle power: expandable if right is constant 2 or 3
-            if isinstance(node.right, Number) and node.right.value in (2, 3):
-                base = expand_to_polynomial(node.left)
-                result = base
-                for _ in range(node.right.value - 1):
-                    result = result * base
-                return result
-            else:
-                # Non-expandable: treat as atomic
-                expr_str = ast_to_string(node)
-                atomic = AtomicExpr(node, expr_str)
-                return Polynomial({frozenset([(atomic, 1)]): 1})
+        # Special case 3: 0^x = 0 (zero to any positive power is 0)
+        if node.left._kind == KIND_NUMBER and node.left.value == 0:
+            return Polynomial()  # Return 0
         
-        elif node.op == '/':
-            # Division is non-expandable: treat as atomic
-            expr_str = ast_to_string(node)
-            atomic = AtomicExpr(node, expr_str)
-            return Polynomial({frozenset([(atomic, 1)]): 1})
+        # Special case 4: 1^x = 1 (one to any power is 1)
+        if node.left._kind == KIND_NUMBER and node.left.value == 1:
+            return Polynomial({(): 1})  # Return 1
         
+        # Handle power: the base was expanded only if _expands_power allows the power
+        if operands:
+            # Specialized on the literal exponent: squaring skips duplicate cross terms
+            return operands[0] ** node.right.value
         else:
-            raise ValueError(f"Unsupported binary operator: {node.op}")
+            # Non-expandable: treat as atomic
+            return _atomic_polynomial(node)
     
-    elif isinstance(node, FunctionCall):
-        # Functions are atomic and non-expandable
-        expr_str = ast_to_string(node)
-        atomic = AtomicExpr(node, expr_str)
-        return Polynomial({frozenset([(atomic, 1)]): 1})
+    elif node.op == '/':
+        # Division is non-expandable: treat as atomic
+        return _atomic_polynomial(node)
     
     else:
-        raise ValueError(f"Unsupported AST node type: {type(node)}")
+        raise ValueError(f"Unsupported binary operator: {node.op}")
+
 
+def _expand_function(node: FunctionCall) -> Polynomial:
+    # Functions are atomic and non-expandable
+    return _atomic_polynomial(node)
 
+
+def _expand_unknown(node: ASTNode) -> Polynomial:
+    raise ValueError(f"Unsupported AST node type: {type(node)}")
+
+
+# Indexed by node._kind
+_EXPAND = (
+    _expand_number,
+    _expand_variable,
+    _expand_binop,
+    _expand_unary,
+    _expand_function,
+    _expand_unknown,
+)
+
+
+@lru_cache(maxsize=MEMO_CACHE_SIZE)
 def normalize_expression(node: ASTNode) -> Polynomial:
     """
     Normalize an expression to polynomial form if possible.
     If the expression contains non-expandable operations, those become atomic variables.
+    Results are memoized per (hash-consed) node; callers must not mutate the returned polynomial.
     """
     return expand_to_polynomial(node)
+
+
+# Modulus for polynomial fingerprints (the Mersenne prime 2^61 - 1)
+_FINGERPRINT_MOD = (1 << 61) - 1
+
+# Horner's rule is used for a univariate fingerprint only while the degree is at most
+# this many times the number of terms; sparser polynomials evaluate term by term
+_HORNER_DENSITY = 4
+
+
+def _fingerprint_tag(key: tuple) -> int:
+    """Pseudo-random evaluation point for a variable or atomic expression."""
+    return hash(key) % _FINGERPRINT_MOD
+
+
+def products_differ(a: Polynomial, b: Polynomial, c: Polynomial, d: Polynomial) -> bool:
+    """
+    True if the fingerprints prove a*b != c*d. False means the products are equal
+    with overwhelming probability and should be confirmed on the real terms.
+    """
+    return (a.fingerprint() * b.fingerprint() - c.fingerprint() * d.fingerprint()) % _FINGERPRINT_MOD != 0
+
+
+def _variable_fingerprint(var) -> int:
+    """Evaluation point of a polynomial variable (a name or an AtomicExpr)."""
+    if isinstance(var, AtomicExpr):
+        return _fingerprint_tag(('AtomicExpr', var.expr_str))
+    return _fingerprint_tag(('Variable', var))
+
+
+@lru_cache(maxsize=MEMO_CACHE_SIZE)
+def polynomial_fingerprint(node: ASTNode) -> int:
+    """
+    Fingerprint the normalized polynomial of an expression in one bottom-up pass.
+    The polynomial is evaluated modulo a large prime with every variable and atomic
+    expression replaced by a pseudo-random value, following the same expansion rules
+    as expand_to_polynomial. Equal polynomials always share a fingerprint, while
+    different ones collide only with negligible probability, so a mismatch proves
+    two expressions normalize differently without building either Polynomial.
+    """
+    return _fold_expansion(node, _FINGERPRINT)
+
+
+def _fingerprint_number(node: Number) -> int:
+    return node.value % _FINGERPRINT_MOD
+
+
+def _fingerprint_variable(node: Variable) -> int:
+    return _fingerprint_tag(('Variable', node.name))
+
+
+def _fingerprint_atomic(node: ASTNode) -> int:
+    return _fingerprint_tag(('AtomicExpr', ast_to_string(node)))
+
+
+def _fingerprint_unary(node: UnaryOp, operand: Optional[int] = None) -> int:
+    if node.op == '-':
+        return -operand % _FINGERPRINT_MOD
+    else:
+        raise ValueError(f"Unsupported unary operator: {node.op}")
+
+
+def _fingerprint_binop(node: BinOp, *operands: int) -> int:
+    mod = _FINGERPRINT_MOD
+    op = node.op
+    
+    if op == '+':
+        left, right = operands
+        return (left + right) % mod
+    
+    elif op == '-':
+        left, right = operands
+        return (left - right) % mod
+    
+    elif op == '*':
+        left, right = operands
+        return left * right % mod
+    
+    elif op == '^':
+        # Same special cases as expand_to_polynomial
+        if node.right._kind == KIND_NUMBER and node.right.value == 0:
+            return 1
+        if node.right._kind == KIND_NUMBER and node.right.value == 1:
+            return operands[0]
+        if node.left._kind == KIND_NUMBER and node.left.value == 0:
+            return 0
+        if node.left._kind == KIND_NUMBER and node.left.value == 1:
+            return 1
+        if operands:
+            return pow(operands[0], node.right.value, mod)
+        return _fingerprint_atomic(node)
+    
+    elif op == '/':
+        return _fingerprint_atomic(node)
+    
+    else:
+        raise ValueError(f"Unsupported binary operator: {op}")
+
+
+# Indexed by node._kind
+_FINGERPRINT = (
+    _fingerprint_number,
+    _fingerprint_variable,
+    _fingerprint_binop,
+    _fingerprint_unary,
+    _fingerprint_atomic,
+    _expand_unknown,
+)
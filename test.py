@@ -5,15 +5,18 @@ Main Module - 数学表达式分析器测试系统
 2. 等价性检查：判断两个表达式是否相等
 """
 
+import argparse
 import json
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
 from datetime import datetime
 from lexer import tokenize
-from parser import parse
-from ast_nodes import print_ast
+from parser import parse_cached, parse_tokens
+from ast_nodes import format_ast
 from polynomial import normalize_expression
-from equality import are_equivalent, check_equivalence_verbose
+from equality import are_equivalent, check_equivalence_verbose, group_equivalent, compile_reference
 
 
 # ============================================================================
@@ -21,21 +24,52 @@ from equality import are_equivalent, check_equivalence_verbose
 # ============================================================================
 
 class TeeOutput:
-    """同时输出到控制台和文件的工具类"""
+    """同时输出到控制台和文件的工具类 (控制台逐行写出，文件攒满一块再写出)"""
+    
+    # 文件缓冲区超过该字符数时写出
+    BUFFER_LIMIT = 4096
     
     def __init__(self, filename: str):
         self.terminal = sys.stdout
-        self.log = open(filename, 'w', encoding='utf-8')
+        self.log = open(filename, 'w', encoding='utf-8', buffering=65536)
+        self._line = []
+        self._buf = []
+        self._buflen = 0
     
     def write(self, message):
-        self.terminal.write(message)
-        self.log.write(message)
+        # print 每条语句调用两次 write (内容 + 换行)，逐次写两个流开销很大:
+        # 控制台攒到换行再写出并刷新，保证进度实时可见；文件按 4 KB 成块写出
+        self._line.append(message)
+        if '\n' in message:
+            self._write_terminal()
+        self._buf.append(message)
+        self._buflen += len(message)
+        if self._buflen > self.BUFFER_LIMIT:
+            self._drain()
+    
+    def _write_terminal(self):
+        """把已攒下的行写到控制台并刷新"""
+        if self._line:
+            self.terminal.write("".join(self._line))
+            self._line.clear()
+            self.terminal.flush()
+    
+    def _drain(self):
+        """把文件缓冲区内容写到 LOG 文件"""
+        if self._buf:
+            self.log.write("".join(self._buf))
+            self._buf.clear()
+            self._buflen = 0
     
     def flush(self):
+        self._write_terminal()
         self.terminal.flush()
+        self._drain()
         self.log.flush()
     
     def close(self):
+        self._write_terminal()
+        self._drain()
         self.log.close()
 
 
@@ -45,6 +79,10 @@ class TeeOutput:
 # 工具函数
 # ============================================================================
 
+# --quick 模式下每个分类默认运行的测试数
+QUICK_LIMIT = 5
+
+
 def print_section(title: str):
     """打印格式化的章节标题"""
     print(f"\n{'=' * 80}")
@@ -80,11 +118,70 @@ def load_test_cases(json_file: str = "test_cases.json") -> dict:
         return {}
 
 
+def quick_subset(task_data: dict, items_key: str, limit: int) -> dict:
+    """
+    截取每个分类的前 limit 个测试，用于快速冒烟测试
+    
+    Args:
+        task_data: 某个任务的测试数据
+        items_key: 分类中测试列表的键名 ('expressions' 或 'pairs')
+        limit: 每个分类保留的测试数
+    
+    Returns:
+        截取后的任务数据 (不修改原数据)
+    """
+    test_groups = [
+        {**test_group, items_key: test_group.get(items_key, [])[:limit]}
+        for test_group in task_data.get('test_cases', [])
+    ]
+    return {**task_data, 'test_cases': test_groups}
+
+
 # ============================================================================
 # Task 1: 表达式分析 (分词 + AST)
 # ============================================================================
 
-def analyze_expression(expr_str: str, show_details: bool = True):
+def pretokenize(expressions) -> dict:
+    """
+    对整个测试语料只做一次词法分析
+    
+    Args:
+        expressions: 表达式字符串的可迭代对象 (可含重复)
+    
+    Returns:
+        {表达式: Token 列表}，分词失败的表达式不放入字典
+    """
+    tokens_by_expr = {}
+    for expr in set(expressions):
+        try:
+            tokens_by_expr[expr] = tokenize(expr)
+        except ValueError:
+            # 留给 analyze_expression 重新分词并报告错误
+            pass
+    return tokens_by_expr
+
+
+def lookup_ast(expr_str: str, ast_cache: dict = None):
+    """
+    取表达式的 AST：优先查 ast_cache，未命中时解析 (解析失败抛出 ValueError)
+    
+    Args:
+        expr_str: 表达式字符串
+        ast_cache: {表达式: AST} 字典，为 None 时只使用 parse_cached
+    
+    Returns:
+        表达式的 AST
+    """
+    if ast_cache is None:
+        return parse_cached(expr_str)
+    ast = ast_cache.get(expr_str)
+    if ast is None:
+        ast = ast_cache[expr_str] = parse_cached(expr_str)
+    return ast
+
+
+def analyze_expression(expr_str: str, show_details: bool = True, tokens: list = None,
+                       ast_cache: dict = None):
     """
     Task 1: 分析单个表达式
     显示: 输入 → 词法分析(Tokens) → 语法分析(AST) → 规范化
@@ -92,6 +189,8 @@ def analyze_expression(expr_str: str, show_details: bool = True):
     Args:
         expr_str: 表达式字符串
         show_details: 是否显示详细信息
+        tokens: 预先计算的 Token 列表，为 None 时重新分词
+        ast_cache: {表达式: AST} 字典，解析结果写入其中供 Task 2 复用
     
     Returns:
         (success: bool, error_msg: str or None)
@@ -102,23 +201,29 @@ def analyze_expression(expr_str: str, show_details: bool = True):
     
     try:
         # Step 1: 词法分析 (Tokenization)
-        tokens = tokenize(expr_str)
+        if tokens is None:
+            tokens = tokenize(expr_str)
         
         if show_details:
-            print("📝 词法分析 (Tokens):")
+            # 先拼好整段输出再一次写出，而不是每个 Token 调用一次 print
+            lines = ["📝 词法分析 (Tokens):"]
             for token in tokens:
                 token_type = token.type.name
                 # 高亮隐式乘法
-                if token.type.name == 'IMPLICIT_MULTIPLY':
+                if token_type == 'IMPLICIT_MULTIPLY':
                     token_type = f"*{token_type}*"
-                print(f"  {token_type:22} | value={repr(token.value):10} | pos={token.pos}")
+                lines.append(f"  {token_type:22} | value={repr(token.value):10} | pos={token.pos}")
+            print("\n".join(lines))
         
-        # Step 2: 语法分析 (Parsing to AST)
-        ast = parse(expr_str)
+        # Step 2: 语法分析 (Parsing to AST)，直接复用上面的 Token，避免重复分词
+        ast = ast_cache.get(expr_str) if ast_cache is not None else None
+        if ast is None:
+            ast = parse_tokens(tokens)
+            if ast_cache is not None:
+                ast_cache[expr_str] = ast
         
         if show_details:
-            print("\n🌳 语法分析 (AST):")
-            print_ast(ast, indent=2)
+            print("\n".join(format_ast(ast, 2, ["\n🌳 语法分析 (AST):"])))
         
         # Step 3: 规范化 (Normalization)
         try:
@@ -137,12 +242,13 @@ def analyze_expression(expr_str: str, show_details: bool = True):
         return False, str(e)
 
 
-def run_task1_expression_analysis(test_data: dict):
+def run_task1_expression_analysis(test_data: dict, ast_cache: dict = None):
     """
     运行 Task 1: 表达式分析测试
     
     Args:
         test_data: Task 1 的测试数据
+        ast_cache: {表达式: AST} 字典，与 Task 2 共享
     """
     print_section("TASK 1: 表达式分析 (分词 + AST)")
     print(f"说明: {test_data.get('description', '')}\n")
@@ -151,7 +257,12 @@ def run_task1_expression_analysis(test_data: dict):
     passed_tests = 0
     failed_tests = []
     
-    for test_group in test_data.get('test_cases', []):
+    test_groups = test_data.get('test_cases', [])
+    tokens_by_expr = pretokenize(
+        expr for test_group in test_groups for expr in test_group.get('expressions', [])
+    )
+    
+    for test_group in test_groups:
         category = test_group.get('category', 'Unknown')
         expressions = test_group.get('expressions', [])
         
@@ -159,7 +270,8 @@ def run_task1_expression_analysis(test_data: dict):
         
         for expr in expressions:
             total_tests += 1
-            success, error = analyze_expression(expr, show_details=True)
+            success, error = analyze_expression(expr, show_details=True, tokens=tokens_by_expr.get(expr),
+                                                ast_cache=ast_cache)
             
             if success:
                 passed_tests += 1
@@ -182,7 +294,8 @@ def run_task1_expression_analysis(test_data: dict):
 # Task 2: 等价性检查
 # ============================================================================
 
-def check_equivalence(expr1_str: str, expr2_str: str, expected: bool = None) -> tuple:
+def check_equivalence(expr1_str: str, expr2_str: str, expected: bool = None,
+                      ast_cache: dict = None) -> tuple:
     """
     Task 2: 检查两个表达式是否等价
     
@@ -190,13 +303,14 @@ def check_equivalence(expr1_str: str, expr2_str: str, expected: bool = None) ->
         expr1_str: 第一个表达式字符串
         expr2_str: 第二个表达式字符串
         expected: 期望的结果 (True/False/None)
+        ast_cache: {表达式: AST} 字典，复用 Task 1 已解析的 AST
     
     Returns:
         (is_equivalent: bool, is_correct: bool, method: str, details: str)
     """
     try:
-        ast1 = parse(expr1_str)
-        ast2 = parse(expr2_str)
+        ast1 = lookup_ast(expr1_str, ast_cache)
+        ast2 = lookup_ast(expr2_str, ast_cache)
         
         is_equiv, method, details = check_equivalence_verbose(ast1, ast2)
         
@@ -228,12 +342,40 @@ def print_equivalence_result(expr1: str, expr2: str, is_equiv: bool, is_correct:
     print(f"{correct_symbol} {expr1:25} ≟ {expr2:25} → {status_symbol} {equiv_text:6} ({method})")
 
 
-def run_task2_equivalence_checking(test_data: dict):
+def check_all_equivalences(tasks: list, jobs: int = 1, ast_cache: dict = None) -> list:
+    """
+    批量执行等价性检查，结果顺序与输入一致
+    
+    Args:
+        tasks: (expr1, expr2, expected) 元组列表
+        jobs: 并行进程数，1 表示串行执行
+        ast_cache: {表达式: AST} 字典，仅串行执行时使用
+    
+    Returns:
+        每个任务的 check_equivalence 结果列表
+    """
+    exprs1 = [task[0] for task in tasks]
+    exprs2 = [task[1] for task in tasks]
+    expected = [task[2] for task in tasks]
+    
+    if jobs <= 1:
+        return list(map(check_equivalence, exprs1, exprs2, expected, repeat(ast_cache)))
+    
+    # 各检查之间无共享状态，可直接分发到多个进程
+    # (AST 节点经过驻留，无法 pickle，因此子进程各自解析，不传 ast_cache)
+    chunksize = max(1, len(tasks) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(check_equivalence, exprs1, exprs2, expected, chunksize=chunksize))
+
+
+def run_task2_equivalence_checking(test_data: dict, jobs: int = 1, ast_cache: dict = None):
     """
     运行 Task 2: 等价性检查测试
     
     Args:
         test_data: Task 2 的测试数据
+        jobs: 并行进程数，1 表示串行执行
+        ast_cache: {表达式: AST} 字典，与 Task 1 共享
     """
     print_section("TASK 2: 等价性检查")
     print(f"说明: {test_data.get('description', '')}\n")
@@ -242,7 +384,16 @@ def run_task2_equivalence_checking(test_data: dict):
     passed_tests = 0
     failed_tests = []
     
-    for test_group in test_data.get('test_cases', []):
+    # 先批量计算所有结果，再按分类顺序打印
+    test_groups = test_data.get('test_cases', [])
+    tasks = [
+        (expr1, expr2, test_group.get('should_be_equivalent', None))
+        for test_group in test_groups
+        for expr1, expr2 in test_group.get('pairs', [])
+    ]
+    results = iter(check_all_equivalences(tasks, jobs, ast_cache))
+    
+    for test_group in test_groups:
         category = test_group.get('category', 'Unknown')
         should_be_equivalent = test_group.get('should_be_equivalent', None)
         pairs = test_group.get('pairs', [])
@@ -252,9 +403,7 @@ def run_task2_equivalence_checking(test_data: dict):
         for expr1, expr2 in pairs:
             total_tests += 1
             
-            is_equiv, is_correct, method, details = check_equivalence(
-                expr1, expr2, expected=should_be_equivalent
-            )
+            is_equiv, is_correct, method, details = next(results)
             
             print_equivalence_result(expr1, expr2, is_equiv, is_correct, method)
             
@@ -278,6 +427,113 @@ def run_task2_equivalence_checking(test_data: dict):
             print(f"    实际: {actual_text}, 期望: {expected_text}")
 
 
+# ============================================================================
+# Task 3: 批量分组
+# ============================================================================
+
+def run_task3_grouping(test_data: dict, ast_cache: dict = None):
+    """
+    运行 Task 3: 批量分组测试 (group_equivalent 返回的组号需与期望完全一致)
+    
+    Args:
+        test_data: Task 3 的测试数据
+        ast_cache: {表达式: AST} 字典，与 Task 1/2 共享
+    """
+    print_section("TASK 3: 批量分组")
+    print(f"说明: {test_data.get('description', '')}\n")
+    
+    total_tests = 0
+    passed_tests = 0
+    failed_tests = []
+    
+    for test_group in test_data.get('test_cases', []):
+        category = test_group.get('category', 'Unknown')
+        expressions = test_group.get('expressions', [])
+        expected = test_group.get('expected_groups', [])
+        
+        print_subsection(f"分类: {category} ({len(expressions)} 个表达式)")
+        total_tests += 1
+        
+        try:
+            actual = group_equivalent([lookup_ast(expr, ast_cache) for expr in expressions])
+        except Exception as e:
+            actual = f"错误: {e}"
+        
+        for expr, group in zip(expressions, actual if isinstance(actual, list) else []):
+            print(f"  组 {group}: {expr}")
+        
+        if actual == expected:
+            passed_tests += 1
+            print(f"✓ 分组正确: {actual}")
+        else:
+            failed_tests.append((category, actual, expected))
+            print(f"✗✗ 分组错误: 实际 {actual}, 期望 {expected}")
+    
+    # 打印汇总
+    print_subsection("Task 3 汇总")
+    print(f"总计: {total_tests} 个测试")
+    print(f"✓ 正确: {passed_tests}")
+    print(f"✗ 错误: {len(failed_tests)}")
+    
+    if failed_tests:
+        print(f"\n错误的测试 (分组与预期不符):")
+        for category, actual, expected in failed_tests:
+            print(f"  - {category}")
+            print(f"    实际: {actual}, 期望: {expected}")
+
+
+# ============================================================================
+# Task 4: 参考表达式检查
+# ============================================================================
+
+def run_task4_reference_checking(test_data: dict, ast_cache: dict = None):
+    """
+    运行 Task 4: 参考表达式检查测试
+    对 Task 2 的每一对表达式，分别以任一方为参考表达式，
+    compile_reference 生成的检查函数须与 are_equivalent 的结果一致
+    
+    Args:
+        test_data: Task 2 的测试数据 (复用其表达式对)
+        ast_cache: {表达式: AST} 字典，与 Task 1/2 共享
+    """
+    print_section("TASK 4: 参考表达式检查")
+    print("说明: Task 4: compile_reference(r)(e) 应与 are_equivalent(r, e) 一致 (复用 Task 2 的表达式对)\n")
+    
+    total_tests = 0
+    passed_tests = 0
+    failed_tests = []
+    
+    for test_group in test_data.get('test_cases', []):
+        for expr1, expr2 in test_group.get('pairs', []):
+            total_tests += 1
+            try:
+                ast1 = lookup_ast(expr1, ast_cache)
+                ast2 = lookup_ast(expr2, ast_cache)
+                consistent = all(
+                    compile_reference(reference)(expr) == are_equivalent(reference, expr)
+                    for reference, expr in ((ast1, ast2), (ast2, ast1))
+                )
+            except Exception as e:
+                consistent = False
+                print(f"✗✗ {expr1} ≟ {expr2}: 错误: {e}")
+            
+            if consistent:
+                passed_tests += 1
+            else:
+                failed_tests.append((expr1, expr2))
+    
+    # 打印汇总
+    print_subsection("Task 4 汇总")
+    print(f"总计: {total_tests} 个测试")
+    print(f"✓ 一致: {passed_tests}")
+    print(f"✗ 不一致: {len(failed_tests)}")
+    
+    if failed_tests:
+        print(f"\n不一致的测试:")
+        for expr1, expr2 in failed_tests:
+            print(f"  - {expr1} ≟ {expr2}")
+
+
 # ============================================================================
 # 主程序
 # ============================================================================
@@ -286,6 +542,24 @@ def main():
     """
     主程序：从 JSON 加载测试案例并运行所有测试
     """
+    arg_parser = argparse.ArgumentParser(description="数学表达式分析器 - 自动化测试系统")
+    arg_parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=1,
+        help="Task 2 等价性检查的并行进程数 (默认: 1，串行)"
+    )
+    arg_parser.add_argument(
+        "--quick",
+        type=int,
+        nargs="?",
+        const=QUICK_LIMIT,
+        default=None,
+        metavar="N",
+        help=f"快速模式: 每个分类只运行前 N 个测试 (默认 N={QUICK_LIMIT})，不指定时运行全部测试"
+    )
+    args = arg_parser.parse_args()
+    
     # 生成输出文件名（带时间戳）
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     log_file = f"test_results_{timestamp}.log"
@@ -306,9 +580,11 @@ def main():
         
         print_section("数学表达式分析器 - 自动化测试系统")
         print("测试配置文件: test_cases.json")
-        print("包含两个主要任务:")
+        print("包含以下任务:")
         print("  - Task 1: 表达式分析 (分词 + AST)")
         print("  - Task 2: 等价性检查")
+        print("  - Task 3: 批量分组")
+        print("  - Task 4: 参考表达式检查")
         
         # 加载测试案例
         test_cases = load_test_cases("test_cases.json")
@@ -317,18 +593,41 @@ def main():
             print("\n✗ 无法加载测试案例，程序退出")
             return
         
+        if args.quick is not None:
+            print(f"\n⚡ 快速模式: 每个分类只运行前 {args.quick} 个测试")
+            if 'task1_expression_analysis' in test_cases:
+                test_cases['task1_expression_analysis'] = quick_subset(
+                    test_cases['task1_expression_analysis'], 'expressions', args.quick)
+            if 'task2_equivalence_checking' in test_cases:
+                test_cases['task2_equivalence_checking'] = quick_subset(
+                    test_cases['task2_equivalence_checking'], 'pairs', args.quick)
+        
+        # 两个任务共享的 AST 缓存: 每个表达式只解析一次
+        ast_cache = {}
+        
         # Task 1: 表达式分析
         if 'task1_expression_analysis' in test_cases:
-            run_task1_expression_analysis(test_cases['task1_expression_analysis'])
+            run_task1_expression_analysis(test_cases['task1_expression_analysis'], ast_cache)
         else:
             print("\n⚠ 未找到 Task 1 测试案例")
         
         # Task 2: 等价性检查
         if 'task2_equivalence_checking' in test_cases:
-            run_task2_equivalence_checking(test_cases['task2_equivalence_checking'])
+            run_task2_equivalence_checking(test_cases['task2_equivalence_checking'], jobs=args.jobs,
+                                           ast_cache=ast_cache)
         else:
             print("\n⚠ 未找到 Task 2 测试案例")
         
+        # Task 3: 批量分组 (每个分类是一组完整的表达式列表，快速模式下不截取)
+        if 'task3_grouping' in test_cases:
+            run_task3_grouping(test_cases['task3_grouping'], ast_cache)
+        else:
+            print("\n⚠ 未找到 Task 3 测试案例")
+        
+        # Task 4: 参考表达式检查 (复用 Task 2 的表达式对)
+        if 'task2_equivalence_checking' in test_cases:
+            run_task4_reference_checking(test_cases['task2_equivalence_checking'], ast_cache)
+        
         print_section("测试完成")
         print(f"\n✓ LOG 文件已保存到: {log_file}")
         
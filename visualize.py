@@ -4,17 +4,68 @@ Renders Abstract Syntax Trees as beautiful images using Graphviz.
 """
 
 # Import from our local ast module (not Python's standard ast module)
+import hashlib
 import sys
 import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+from functools import lru_cache
 from ast_nodes import ASTNode, Number, Variable, BinOp, UnaryOp, FunctionCall
-from typing import Optional
+from typing import List, Optional
+
+# Folder every generated image is saved in
+_IMAGES_DIR = Path("images")
+_images_dir_ready = False
+
+# Optional dependency, looked up once; the render functions raise ImportError when missing
+try:
+    import graphviz
+except ImportError:
+    graphviz = None
+
+
+# Characters that need escaping inside a double-quoted DOT string
+_DOT_ESCAPE = str.maketrans({'\\': '\\\\', '"': '\\"', '\n': '\\n'})
+
+
+def _dot_escape(text: str) -> str:
+    """Escape text for use inside a double-quoted DOT string (one pass in C)."""
+    return text.translate(_DOT_ESCAPE)
+
+
+def _node_attributes(shape: str, color: str, fontcolor: str) -> str:
+    """DOT attribute list shared by every node of one kind (everything but the label)."""
+    return (f'shape={shape}, style=filled, fillcolor="{color}", fontcolor="{fontcolor}", '
+            f'fontsize=14, fontname="Arial Bold"')
+
+
+# Node style per AST kind, indexed by node._kind
+_NODE_STYLES = (
+    _node_attributes("circle", "#E8F5E9", "#1B5E20"),   # Number: light green
+    _node_attributes("circle", "#E3F2FD", "#0D47A1"),   # Variable: light blue
+    _node_attributes("diamond", "#FFF3E0", "#E65100"),  # BinOp: light orange
+    _node_attributes("diamond", "#FCE4EC", "#880E4F"),  # UnaryOp: light pink
+    _node_attributes("box", "#F3E5F5", "#4A148C"),      # FunctionCall: light purple
+    _node_attributes("ellipse", "#EEEEEE", "#000000"),  # Unknown node type
+)
+
+# Graph-wide settings opening every generated DOT document
+_GRAPH_SETTINGS = [
+    "  rankdir=TB;",  # Top to bottom layout
+    '  node [fontname="Arial"];',
+    '  edge [color="#666666", penwidth=2];',
+    '  bgcolor="#FAFAFA";',
+]
 
 
 def ast_to_dot(node: ASTNode, node_id: int = 0, parent_id: Optional[int] = None) -> tuple:
     """
     Convert AST to DOT format for Graphviz.
+    Nodes are numbered in pre-order (parent, then left to right). The labels, styles
+    and tree shape come from the memoized _dot_fragment, so only the node IDs are
+    formatted here.
     
     Args:
         node: AST node to convert
@@ -24,79 +75,81 @@ def ast_to_dot(node: ASTNode, node_id: int = 0, parent_id: Optional[int] = None)
     Returns:
         (dot_lines, next_node_id) where dot_lines is a list of DOT format lines
     """
+    fragment = _dot_fragment(node)
     dot_lines = []
-    current_id = node_id
-    next_id = node_id + 1
-    
-    # Determine node label and style
-    if isinstance(node, Number):
-        label = str(node.value)
-        shape = "circle"
-        color = "#E8F5E9"  # Light green
-        fontcolor = "#1B5E20"
-    
-    elif isinstance(node, Variable):
-        label = node.name
-        shape = "circle"
-        color = "#E3F2FD"  # Light blue
-        fontcolor = "#0D47A1"
-    
-    elif isinstance(node, BinOp):
-        label = node.op
-        shape = "diamond"
-        color = "#FFF3E0"  # Light orange
-        fontcolor = "#E65100"
-    
-    elif isinstance(node, UnaryOp):
-        label = node.op
-        shape = "diamond"
-        color = "#FCE4EC"  # Light pink
-        fontcolor = "#880E4F"
-    
-    elif isinstance(node, FunctionCall):
-        label = node.func_name
-        shape = "box"
-        color = "#F3E5F5"  # Light purple
-        fontcolor = "#4A148C"
-    
-    else:
-        label = str(type(node).__name__)
-        shape = "ellipse"
-        color = "#EEEEEE"
-        fontcolor = "#000000"
-    
-    # Add current node
-    dot_lines.append(
-        f'  node{current_id} [label="{label}", shape={shape}, '
-        f'style=filled, fillcolor="{color}", fontcolor="{fontcolor}", '
-        f'fontsize=14, fontname="Arial Bold"];'
-    )
-    
-    # Add edge from parent if exists
-    if parent_id is not None:
-        dot_lines.append(f'  node{parent_id} -> node{current_id};')
+    append = dot_lines.append
     
-    # Process children
-    if isinstance(node, BinOp):
-        # Left child
-        left_lines, next_id = ast_to_dot(node.left, next_id, current_id)
-        dot_lines.extend(left_lines)
+    for current_id, (parent_index, attributes) in enumerate(fragment, node_id):
+        # Add current node
+        append(f'  node{current_id} [{attributes}];')
         
-        # Right child
-        right_lines, next_id = ast_to_dot(node.right, next_id, current_id)
-        dot_lines.extend(right_lines)
+        # Add edge from parent if exists (the root hangs off the caller's parent_id)
+        edge_from = parent_id if parent_index is None else node_id + parent_index
+        if edge_from is not None:
+            append(f'  node{edge_from} -> node{current_id};')
     
-    elif isinstance(node, UnaryOp):
-        # Operand
-        operand_lines, next_id = ast_to_dot(node.operand, next_id, current_id)
-        dot_lines.extend(operand_lines)
+    return dot_lines, node_id + len(fragment)
+
+
+@lru_cache(maxsize=256)
+def _dot_fragment(node: ASTNode) -> tuple:
+    """
+    ID-independent DOT description of a tree: one (parent_index, attributes) pair per
+    node in pre-order, where parent_index is the parent's position (None for the root).
+    Memoized per (hash-consed) node, so re-rendering a tree only renumbers it.
+    Built with an explicit stack, so deep trees do not hit the recursion limit.
+    """
+    entries = []
+    stack = [(node, None)]
     
-    elif isinstance(node, FunctionCall):
-        # Argument
-        arg_lines, next_id = ast_to_dot(node.arg, next_id, current_id)
-        dot_lines.extend(arg_lines)
+    while stack:
+        node, parent_index = stack.pop()
+        index = len(entries)
+        
+        # Node label and children, then the style preformatted for the node kind
+        kind = node._kind
+        label, children = _DOT_HANDLERS[kind](node)
+        entries.append((parent_index, f'label="{_dot_escape(label)}", {_NODE_STYLES[kind]}'))
+        
+        # Push children right to left so the left subtree is emitted (and numbered) first
+        stack.extend([(child, index) for child in reversed(children)])
     
-    return dot_lines, next_id
+    return tuple(entries)
+
+
+def _dot_number(node: Number) -> tuple:
+    return str(node.value), ()
+
+
+def _dot_variable(node: Variable) -> tuple:
+    return node.name, ()
+
+
+def _dot_binop(node: BinOp) -> tuple:
+    return node.op, (node.left, node.right)
+
+
+def _dot_unaryop(node: UnaryOp) -> tuple:
+    return node.op, (node.operand,)
+
+
+def _dot_function_call(node: FunctionCall) -> tuple:
+    return node.func_name, (node.arg,)
+
+
+def _dot_unknown(node: ASTNode) -> tuple:
+    return str(type(node).__name__), ()
+
+
+# (label, children) of a node, indexed by node._kind
+_DOT_HANDLERS = (
+    _dot_number,
+    _dot_variable,
+    _dot_binop,
+    _dot_unaryop,
+    _dot_function_call,
+    _dot_unknown,
+)
 
 
 def render_ast(node: ASTNode, output_path: str = "ast_tree.png", format: str = "png", title: str = None) -> str:
@@ -112,9 +165,7 @@ def render_ast(node: ASTNode, output_path: str = "ast_tree.png", format: str = "
     Returns:
         Path to the generated image file
     """
-    try:
-        import graphviz
-    except ImportError:
+    if graphviz is None:
         raise ImportError(
             "graphviz package is required for AST visualization.\n"
             "Install it with: pip install graphviz\n"
@@ -127,33 +178,39 @@ def render_ast(node: ASTNode, output_path: str = "ast_tree.png", format: str = "
     # Generate DOT format
     dot_lines, _ = ast_to_dot(node)
     
-    # Create DOT source
-    dot_source = "digraph AST {\n"
-    dot_source += "  rankdir=TB;\n"  # Top to bottom layout
-    dot_source += "  node [fontname=\"Arial\"];\n"
-    dot_source += "  edge [color=\"#666666\", penwidth=2];\n"
-    dot_source += "  bgcolor=\"#FAFAFA\";\n"
+    # Create DOT source: collect the lines and join once
+    parts = ["digraph AST {"]
+    parts.extend(_GRAPH_SETTINGS)
     
     # Add title if provided
     if title:
-        dot_source += f'  labelloc="t";\n'
-        dot_source += f'  label="{title}";\n'
-        dot_source += f'  fontsize=20;\n'
-        dot_source += f'  fontname="Arial Bold";\n'
-    
-    dot_source += "\n".join(dot_lines)
-    dot_source += "\n}"
+        parts.append('  labelloc="t";')
+        parts.append(f'  label="{_dot_escape(title)}";')
+        parts.append('  fontsize=20;')
+        parts.append('  fontname="Arial Bold";')
     
-    # Render using graphviz
-    graph = graphviz.Source(dot_source)
+    parts.extend(dot_lines)
+    parts.append("}")
+    dot_source = "\n".join(parts)
     
-    # Remove extension from output_path if present
-    base_path = os.path.splitext(output_path)[0]
+    # Render using graphviz (skipped when the image is up to date)
+    return _render_dot(dot_source, output_path, format)
+
+
+def _image_path(output_path: str) -> str:
+    """Place output_path in the images/ folder, creating the folder if needed."""
+    global _images_dir_ready
     
-    # Render to file
-    output_file = graph.render(base_path, format=format, cleanup=True)
+    # Ensure images directory exists (checked once per process)
+    if not _images_dir_ready:
+        _IMAGES_DIR.mkdir(exist_ok=True)
+        _images_dir_ready = True
     
-    return output_file
+    # Prepend images/ to output path if not already there
+    path = Path(output_path)
+    if path.parts[:1] != _IMAGES_DIR.parts:
+        path = _IMAGES_DIR / path
+    return str(path)
 
 
 def visualize_expression(expression: str, output_path: str = "ast_tree.png") -> str:
@@ -167,18 +224,11 @@ def visualize_expression(expression: str, output_path: str = "ast_tree.png") ->
     Returns:
         Path to the generated image file
     """
-    from parser import parse
+    from parser import parse_cached
     
-    # Ensure images directory exists
-    images_dir = "images"
-    if not os.path.exists(images_dir):
-        os.makedirs(images_dir)
-    
-    # Prepend images/ to output path if not already there
-    if not output_path.startswith(images_dir + "/"):
-        output_path = os.path.join(images_dir, output_path)
+    output_path = _image_path(output_path)
     
-    ast = parse(expression)
+    ast = parse_cached(expression)
     # Add expression as title
     return render_ast(ast, output_path, title=f"Expression: {expression}")
 
@@ -195,70 +245,80 @@ def create_comparison_visualization(expr1: str, expr2: str, output_path: str = "
     Returns:
         Path to the generated image file
     """
-    try:
-        import graphviz
-    except ImportError:
+    if graphviz is None:
         raise ImportError("graphviz package is required for AST visualization.")
     
-    from parser import parse
-    
-    # Ensure images directory exists
-    images_dir = "images"
-    if not os.path.exists(images_dir):
-        os.makedirs(images_dir)
+    from parser import parse_cached
     
-    # Prepend images/ to output path if not already there
-    if not output_path.startswith(images_dir + "/"):
-        output_path = os.path.join(images_dir, output_path)
+    output_path = _image_path(output_path)
     
     # Parse both expressions
-    ast1 = parse(expr1)
-    ast2 = parse(expr2)
+    ast1 = parse_cached(expr1)
+    ast2 = parse_cached(expr2)
     
     # Generate DOT for both trees
-    dot_lines1, max_id1 = ast_to_dot(ast1, node_id=0)
-    dot_lines2, _ = ast_to_dot(ast2, node_id=max_id1 + 1000)  # Offset IDs to avoid conflicts
-    
-    # Create DOT source with subgraphs
-    dot_source = "digraph Comparison {\n"
-    dot_source += "  rankdir=TB;\n"
-    dot_source += "  node [fontname=\"Arial\"];\n"
-    dot_source += "  edge [color=\"#666666\", penwidth=2];\n"
-    dot_source += "  bgcolor=\"#FAFAFA\";\n"
-    dot_source += "  \n"
-    dot_source += "  subgraph cluster_0 {\n"
-    dot_source += f'    label="{expr1}";\n'
-    dot_source += "    fontsize=16;\n"
-    dot_source += "    fontname=\"Arial Bold\";\n"
-    dot_source += "    style=filled;\n"
-    dot_source += "    color=\"#E3F2FD\";\n"
-    dot_source += "    \n"
-    dot_source += "\n".join("  " + line for line in dot_lines1)
-    dot_source += "\n  }\n"
-    dot_source += "  \n"
-    dot_source += "  subgraph cluster_1 {\n"
-    dot_source += f'    label="{expr2}";\n'
-    dot_source += "    fontsize=16;\n"
-    dot_source += "    fontname=\"Arial Bold\";\n"
-    dot_source += "    style=filled;\n"
-    dot_source += "    color=\"#FFF3E0\";\n"
-    dot_source += "    \n"
-    dot_source += "\n".join("  " + line for line in dot_lines2)
-    dot_source += "\n  }\n"
-    dot_source += "}"
-    
-    # Render using graphviz
-    graph = graphviz.Source(dot_source)
-    
+    # The second tree continues the first one's numbering, so IDs never collide
+    dot_lines1, next_id = ast_to_dot(ast1, node_id=0)
+    dot_lines2, _ = ast_to_dot(ast2, node_id=next_id)
+    
+    # Create DOT source with subgraphs: collect the lines and join once
+    parts = ["digraph Comparison {"]
+    parts.extend(_GRAPH_SETTINGS)
+    _append_cluster(parts, 0, expr1, "#E3F2FD", dot_lines1)
+    _append_cluster(parts, 1, expr2, "#FFF3E0", dot_lines2)
+    parts.append("}")
+    dot_source = "\n".join(parts)
+    
+    # Render using graphviz (skipped when the image is up to date)
+    return _render_dot(dot_source, output_path, "png")
+
+
+def _render_dot(dot_source: str, output_path: str, format: str) -> str:
+    """
+    Render DOT source to an image file and return its path.
+    Graphviz runs as an external process, so a digest of the source is stored next
+    to the image (<image>.hash) and rendering is skipped while both still match.
+    """
     # Remove extension from output_path if present
     base_path = os.path.splitext(output_path)[0]
+    output_file = f"{base_path}.{format}"
+    data = dot_source.encode("utf-8")
+    digest = hashlib.blake2b(data, digest_size=8).hexdigest()
     
-    # Render to file
-    output_file = graph.render(base_path, format="png", cleanup=True)
+    if os.path.exists(output_file):
+        try:
+            with open(output_file + ".hash", "r", encoding="utf-8") as f:
+                if f.read() == digest:
+                    return output_file
+        except OSError:
+            pass
+    
+    # Feed the source to dot on stdin and write the image it returns, instead of
+    # saving a temporary .dot file for Source.render to read back and delete
+    image = graphviz.pipe("dot", format, data)
+    with open(output_file, "wb") as f:
+        f.write(image)
+    
+    with open(output_file + ".hash", "w", encoding="utf-8") as f:
+        f.write(digest)
     
     return output_file
 
 
+def _append_cluster(parts: List[str], index: int, label: str, color: str, dot_lines: List[str]) -> None:
+    """Append one labelled subgraph cluster holding a tree's DOT lines."""
+    parts.append("  ")
+    parts.append(f"  subgraph cluster_{index} {{")
+    parts.append(f'    label="{_dot_escape(label)}";')
+    parts.append("    fontsize=16;")
+    parts.append('    fontname="Arial Bold";')
+    parts.append("    style=filled;")
+    parts.append(f'    color="{color}";')
+    parts.append("    ")
+    parts.extend(["  " + line for line in dot_lines])
+    parts.append("  }")
+
+
 def run_examples():
     """Run built-in example visualizations."""
     print("AST Visualization Examples")
@@ -272,19 +332,42 @@ def run_examples():
         ("-x^2", "unary_minus.png"),
     ]
     
-    for expr, filename in examples:
+    from parser import parse_cached
+    
+    # Each render waits on its own dot process, so the examples are rendered
+    # concurrently. Parsing stays in this thread: building AST nodes interns them,
+    # which is not thread-safe.
+    jobs = []
+    with ThreadPoolExecutor(max_workers=len(examples)) as executor:
+        for expr, filename in examples:
+            try:
+                ast = parse_cached(expr)
+            except Exception as e:
+                jobs.append((expr, None, e))
+            else:
+                future = executor.submit(render_ast, ast, _image_path(filename), title=f"Expression: {expr}")
+                jobs.append((expr, future, None))
+        
+        # Comparison example (rendered here while the pool works)
         try:
-            output = visualize_expression(expr, filename)
-            print(f"[OK] Generated: {output} for expression: {expr}")
+            comparison = create_comparison_visualization("x+1", "1+x", "comparison.png")
+            comparison_error = None
         except Exception as e:
-            print(f"[ERROR] {expr}: {e}")
-    
-    # Comparison example
-    try:
-        output = create_comparison_visualization("x+1", "1+x", "comparison.png")
-        print(f"\n[OK] Generated comparison: {output}")
-    except Exception as e:
-        print(f"\n[ERROR] comparison: {e}")
+            comparison_error = e
+        
+        # Report in the original order
+        for expr, future, error in jobs:
+            try:
+                if error is not None:
+                    raise error
+                print(f"[OK] Generated: {future.result()} for expression: {expr}")
+            except Exception as e:
+                print(f"[ERROR] {expr}: {e}")
+    
+    if comparison_error is None:
+        print(f"\n[OK] Generated comparison: {comparison}")
+    else:
+        print(f"\n[ERROR] comparison: {comparison_error}")
 
 
 def main():
@@ -325,8 +408,8 @@ Examples:
     parser.add_argument(
         "-f", "--format",
         default="png",
-        choices=["png", "pdf", "svg", "jpg"],
-        help="Output format (default: png)"
+        choices=["png", "pdf", "svg", "svgz", "jpg"],
+        help="Output format (default: png; svg and svgz are vector output, no rasterization)"
     )
     parser.add_argument(
         "-c", "--compare",
@@ -395,18 +478,11 @@ Examples:
         title = f"Expression: {args.expression}"
     
     try:
-        from parser import parse
-        
-        # Ensure images directory exists
-        images_dir = "images"
-        if not os.path.exists(images_dir):
-            os.makedirs(images_dir)
+        from parser import parse_cached
         
-        # Prepend images/ to output path if not already there
-        if not output_path.startswith(images_dir + "/") and not output_path.startswith(images_dir + "\\"):
-            output_path = os.path.join(images_dir, output_path)
+        output_path = _image_path(output_path)
         
-        ast = parse(args.expression)
+        ast = parse_cached(args.expression)
         output = render_ast(ast, output_path, format=args.format, title=title)
         print(f"[OK] Generated: {output}")
         print(f"  Expression: {args.expression}")